@@ -1,16 +1,24 @@
 # -*- mode: python ; coding: utf-8 -*-
-
+# Build the pre-migrated database first:
+#   python desktop.py --build-db build/desktop/alfurqan_academy.db
+#   pyinstaller AlfurqanAcademy.spec
+# The frozen app.py hands over to desktop.py (see the end of app.py).
 
 a = Analysis(
     ['app.py'],
     pathex=[],
     binaries=[],
-    datas=[('templates', 'templates'), ('static', 'static')],
-    hiddenimports=[],
+    datas=[
+        ('app/templates', 'app/templates'),
+        ('app/static', 'app/static'),
+        ('build/desktop/alfurqan_academy.db', '.'),
+    ],
+    hiddenimports=['desktop'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Not used by the desktop app; leaving them out shrinks the bundle and its unpack time.
+    excludes=['flask_migrate', 'alembic', 'mako', 'psycopg2', 'tkinter'],
     noarchive=False,
     optimize=0,
 )
@@ -1,17 +1,52 @@
+import hashlib
+import io
 import os
+import re
 import secrets
-from datetime import datetime
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 from functools import wraps
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session, g, abort
+import click
+
+from flask import Flask, render_template, request, redirect, url_for, flash, session, g, abort, current_app, make_response, send_file
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session as SQLAlchemySession
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.pool import Pool
 from flask_login import UserMixin, LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from app import compression, init_templates, metrics
+from app.conversions import format_currency, from_kobo, parse_date, to_kobo
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """
+    Sends everything for a campus to that tenant's own database (see TenantEngines below).
+    Otherwise, reads go to the 'replica' bind when the current request is marked read-only
+    (see read_replica below) and everything else, including all flushes, to the primary.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = self.info.get('tenant')
+        if bind is None and tenant is not None:
+            return current_app.extensions['tenant_engines'].get(tenant)
+        if bind is None and self.info.get('read_only') and not self._flushing:
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
 # Initialize extensions
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
 # Define a simple fee structure for demonstration purposes.
@@ -71,13 +106,6 @@ def get_current_school_period():
     return academic_year, current_term
 
 
-def format_currency_filter(value):
-    try:
-        return "{:,.2f}".format(float(value))
-    except (ValueError, TypeError):
-        return value
-
-
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -90,7 +118,7 @@ class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     reg_number = db.Column(db.String(50), unique=True, nullable=False)
     name = db.Column(db.String(120), nullable=False)
-    dob = db.Column(db.String(20))
+    dob = db.Column(db.Date)
     gender = db.Column(db.String(10))
     address = db.Column(db.String(255))
     phone = db.Column(db.String(20))
@@ -98,17 +126,256 @@ class Student(db.Model):
     student_class = db.Column(db.String(50))
     term = db.Column(db.String(50))
     academic_year = db.Column(db.String(20))
-    admission_date = db.Column(db.String(20))
+    admission_date = db.Column(db.Date, index=True)
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_student_period', 'student_reg_number', 'academic_year', 'term'),
+        # One payment per form submission: a resubmitted form carries the same key.
+        db.Index('ux_payments_idempotency_key', 'idempotency_key', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_reg_number = db.Column(db.String(50), db.ForeignKey('students.reg_number'), nullable=False)
     term = db.Column(db.String(50))
     academic_year = db.Column(db.String(20))
-    amount_paid = db.Column(db.Float)
-    payment_date = db.Column(db.String(20))
+    amount_kobo = db.Column(db.BigInteger, nullable=False, default=0)
+    payment_date = db.Column(db.Date, index=True)
     recorded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    idempotency_key = db.Column(db.String(64))
+    # Bumped by claim_payment() for every reversal or correction; SQLAlchemy adds
+    # "AND version = <old>" to the UPDATE and raises StaleDataError if it matched nothing.
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
+
+    @property
+    def amount_paid(self):
+        return from_kobo(self.amount_kobo)
+
+    @amount_paid.setter
+    def amount_paid(self, value):
+        self.amount_kobo = to_kobo(value)
+
+class PaymentEvent(db.Model):
+    """
+    Append-only history of a payment: 'created' once, then optionally 'reversed' or
+    'corrected'. amount_kobo is the signed change, so balances are plain sums.
+    """
+    __tablename__ = 'payment_events'
+    __table_args__ = (
+        # Covers per-student, per-term sums (balances, statements, analytics) without table lookups.
+        db.Index('ix_payment_events_student_amount', 'student_reg_number', 'academic_year', 'term', 'amount_kobo'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'), nullable=False, index=True)
+    student_reg_number = db.Column(db.String(50), nullable=False)
+    academic_year = db.Column(db.String(20))
+    term = db.Column(db.String(50))
+    event_type = db.Column(db.String(20), nullable=False)
+    amount_kobo = db.Column(db.BigInteger, nullable=False)
+    recorded_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+    note = db.Column(db.String(255))
+
+    payment = db.relationship('Payment', backref=db.backref('events', order_by='PaymentEvent.id'))
+
+class BalanceSnapshot(db.Model):
+    """Per-student, per-term balances as of a moment, packed by app.ledger.encode_balances."""
+    __tablename__ = 'balance_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    as_of = db.Column(db.DateTime, nullable=False, unique=True)
+    # Highest payment_events id included; NULL for snapshots taken before it was recorded.
+    last_event_id = db.Column(db.Integer)
+    entries = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class LegacyValue(db.Model):
+    """Original text of legacy values normalize_legacy_columns couldn't convert, to fix by hand."""
+    __tablename__ = 'legacy_values'
+    table_name = db.Column(db.String(64), primary_key=True)
+    row_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    column_name = db.Column(db.String(64), primary_key=True)
+    raw_value = db.Column(db.Text, nullable=False)
+
+class DataVersion(db.Model):
+    """
+    Change counters used for ETags. Scopes are 'students', 'payments' and
+    'student:<reg_number>'; each is bumped in the same transaction as the write.
+    """
+    __tablename__ = 'data_versions'
+    scope = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+@db.event.listens_for(RoutingSession, 'after_flush')
+def bump_data_versions(session, flush_context):
+    scopes = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Student):
+            scopes.update(('students', f'student:{obj.reg_number}'))
+        elif isinstance(obj, (Payment, PaymentEvent)):
+            scopes.update(('payments', f'student:{obj.student_reg_number}'))
+    if scopes:
+        session.connection().execute(
+            db.text('INSERT INTO data_versions (scope, version) VALUES (:scope, 1) '
+                    'ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1'),
+            [{'scope': scope} for scope in sorted(scopes)]
+        )
+
+
+# Statement counts and time, and connection usage, for every engine (primary, replica and
+# tenants) in this process; see app/metrics.py.
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None:
+        metrics.record_query(statement, time.perf_counter() - started)
+
+
+@db.event.listens_for(Pool, 'connect')
+def _connection_opened(dbapi_connection, connection_record):
+    metrics.inc('alfurqan_db_connections_opened_total')
+    metrics.inc('alfurqan_db_connections_open')
+
+
+@db.event.listens_for(Pool, 'close')
+@db.event.listens_for(Pool, 'close_detached')
+def _connection_closed(dbapi_connection, *args):
+    metrics.inc('alfurqan_db_connections_open', -1)
+
+
+@db.event.listens_for(Pool, 'checkout')
+def _connection_checked_out(dbapi_connection, connection_record, connection_proxy):
+    metrics.inc('alfurqan_db_pool_checked_out')
+
+
+@db.event.listens_for(Pool, 'checkin')
+@db.event.listens_for(Pool, 'detach')
+def _connection_returned(dbapi_connection, connection_record):
+    metrics.inc('alfurqan_db_pool_checked_out', -1)
+
+
+def data_versions(*scopes):
+    """Current counters for the given scopes, in one primary-key lookup."""
+    rows = db.session.query(DataVersion.scope, DataVersion.version).filter(DataVersion.scope.in_(scopes)).all()
+    found = dict(rows)
+    return [found.get(scope, 0) for scope in scopes]
+
+
+def total_paid_kobo(student_reg_number, academic_year, term):
+    # Derived from the event log, so reversals and corrections are reflected.
+    return db.session.query(db.func.coalesce(db.func.sum(PaymentEvent.amount_kobo), 0)).filter(
+        PaymentEvent.student_reg_number == student_reg_number,
+        PaymentEvent.term == term,
+        PaymentEvent.academic_year == academic_year
+    ).scalar()
+
+
+def _payment_event(payment, event_type, amount_kobo, recorded_by, note=None):
+    return PaymentEvent(
+        payment=payment,
+        student_reg_number=payment.student_reg_number,
+        academic_year=payment.academic_year,
+        term=payment.term,
+        event_type=event_type,
+        amount_kobo=amount_kobo,
+        recorded_by=recorded_by,
+        note=note
+    )
+
+
+def post_payment(**fields):
+    """Adds a Payment and its 'created' event to the session; the caller commits."""
+    payment = Payment(**fields)
+    db.session.add(payment)
+    db.session.add(_payment_event(payment, 'created', payment.amount_kobo, payment.recorded_by))
+    return payment
+
+
+def current_amount_kobo(payment):
+    return db.session.query(db.func.coalesce(db.func.sum(PaymentEvent.amount_kobo), 0)).filter(
+        PaymentEvent.payment_id == payment.id
+    ).scalar()
+
+
+def claim_payment(payment, expected_version=None):
+    """
+    Takes the payment for a reversal or correction. The row is re-read with FOR UPDATE, so
+    on Postgres concurrent editors queue on the row lock; everywhere, the version bump makes
+    the flush fail with StaleDataError if another transaction changed the payment first.
+    expected_version is the version the user was shown, if any.
+    """
+    db.session.refresh(payment, with_for_update=True)
+    if expected_version is not None and payment.version != expected_version:
+        raise StaleDataError(f'Payment {payment.id} was changed by someone else; reload and try again.')
+    payment.version += 1
+
+
+def reverse_payment(payment, recorded_by, note=None, expected_version=None):
+    claim_payment(payment, expected_version)
+    current = current_amount_kobo(payment)
+    if current == 0:
+        raise ValueError(f'Payment {payment.id} is already reversed.')
+    db.session.add(_payment_event(payment, 'reversed', -current, recorded_by, note))
+
+
+def correct_payment(payment, new_amount, recorded_by, note=None, expected_version=None):
+    claim_payment(payment, expected_version)
+    delta = to_kobo(new_amount) - current_amount_kobo(payment)
+    if delta:
+        db.session.add(_payment_event(payment, 'corrected', delta, recorded_by, note))
+
+
+def balances_at(at, up_to_id=None):
+    """
+    {(reg_number, academic_year, term): kobo} for events recorded up to `at` (and, with
+    up_to_id, with an id no higher than that), replayed from the nearest earlier snapshot
+    rather than from the start of the history. A snapshot covers the events recorded up to
+    its as_of that were committed when it was taken; anything committed later is replayed.
+    """
+    from app.ledger import decode_balances
+
+    if not isinstance(at, datetime):
+        at = datetime.combine(at, datetime.max.time())
+    snapshot = BalanceSnapshot.query.filter(BalanceSnapshot.as_of <= at).order_by(BalanceSnapshot.as_of.desc()).first()
+    balances = decode_balances(snapshot.data) if snapshot else {}
+    events = db.session.query(
+        PaymentEvent.student_reg_number, PaymentEvent.academic_year, PaymentEvent.term, PaymentEvent.amount_kobo
+    ).filter(PaymentEvent.recorded_at <= at)
+    if up_to_id is not None:
+        events = events.filter(PaymentEvent.id <= up_to_id)
+    if snapshot:
+        # Two disjoint index ranges rather than an OR, which neither index can serve.
+        unsnapshotted = events.filter(PaymentEvent.recorded_at > snapshot.as_of)
+        if snapshot.last_event_id is not None:
+            unsnapshotted = unsnapshotted.union_all(events.filter(
+                PaymentEvent.id > snapshot.last_event_id, PaymentEvent.recorded_at <= snapshot.as_of))
+        events = unsnapshotted
+    student_col, year_col, term_col, amount_col = events.subquery().c
+    query = db.session.query(student_col, year_col, term_col, db.func.sum(amount_col))
+    for reg_number, academic_year, term, delta in query.group_by(student_col, year_col, term_col):
+        key = (reg_number, academic_year or '', term or '')
+        balances[key] = balances.get(key, 0) + delta
+    return {key: kobo for key, kobo in balances.items() if kobo}
+
+
+def take_balance_snapshot(as_of=None):
+    """Snapshots balances up to as_of (default: app.ledger.SNAPSHOT_LAG ago) and the last event id included."""
+    from app.ledger import SNAPSHOT_LAG, encode_balances
+
+    as_of = as_of or datetime.now() - SNAPSHOT_LAG
+    last_event_id = db.session.query(db.func.coalesce(db.func.max(PaymentEvent.id), 0)).scalar()
+    balances = balances_at(as_of, up_to_id=last_event_id)
+    db.session.add(BalanceSnapshot(as_of=as_of, last_event_id=last_event_id, entries=len(balances),
+                                   data=encode_balances(balances)))
+    db.session.commit()
+    return len(balances)
 
 
 def get_fee_status(student_reg_number, academic_year_check, term_check):
@@ -116,13 +383,9 @@ def get_fee_status(student_reg_number, academic_year_check, term_check):
     if not student:
         return 'N/A'
     
-    expected_fee = FEE_STRUCTURE.get((student.student_class, term_check), 0.0)
-    total_paid = db.session.query(db.func.sum(Payment.amount_paid)).filter(
-        Payment.student_reg_number == student_reg_number,
-        Payment.term == term_check,
-        Payment.academic_year == academic_year_check
-    ).scalar() or 0.0
-    
+    expected_fee = to_kobo(FEE_STRUCTURE.get((student.student_class, term_check), 0))
+    total_paid = total_paid_kobo(student_reg_number, academic_year_check, term_check)
+
     if expected_fee > 0:
         if total_paid >= expected_fee:
             return 'Paid'
@@ -132,31 +395,836 @@ def get_fee_status(student_reg_number, academic_year_check, term_check):
         return 'N/A'
 
 
+# Event date for legacy payments whose date couldn't be read (their text is in legacy_values):
+# before any real date, like the app package's migration, rather than the day it ran.
+UNKNOWN_PAYMENT_DATE = date(1, 1, 1)
+
+
+def normalize_legacy_columns(engine=None, batch_size=5000):
+    """
+    One-off data migration for databases created before dates and money had proper types.
+    Backfills payments.amount_kobo from the old REAL amount_paid column and rewrites
+    free-text dates as ISO dates, then converts the columns to DATE on Postgres.
+    Runs against `engine` (default: the main database; see current_engine() for a campus).
+    Safe to run more than once.
+    """
+    engine = engine or db.engine
+    LegacyValue.__table__.create(engine, checkfirst=True)
+    inspector = db.inspect(engine)
+    payment_columns = {c['name'] for c in inspector.get_columns('payments')}
+    is_postgres = engine.dialect.name == 'postgresql'
+    converted = 0
+
+    with engine.begin() as conn:
+        if 'idempotency_key' not in payment_columns:
+            conn.execute(db.text('ALTER TABLE payments ADD COLUMN idempotency_key VARCHAR(64)'))
+        if 'version' not in payment_columns:
+            conn.execute(db.text('ALTER TABLE payments ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+        if inspector.has_table('balance_snapshots') and 'last_event_id' not in {
+                c['name'] for c in inspector.get_columns('balance_snapshots')}:
+            conn.execute(db.text('ALTER TABLE balance_snapshots ADD COLUMN last_event_id INTEGER'))
+        if 'amount_paid' in payment_columns:
+            if 'amount_kobo' not in payment_columns:
+                conn.execute(db.text('ALTER TABLE payments ADD COLUMN amount_kobo BIGINT NOT NULL DEFAULT 0'))
+            rows = conn.execute(db.text('SELECT id, amount_paid FROM payments')).fetchall()
+            updates = [{'id': row.id, 'kobo': to_kobo(repr(float(row.amount_paid or 0)))} for row in rows]
+            for i in range(0, len(updates), batch_size):
+                conn.execute(db.text('UPDATE payments SET amount_kobo = :kobo WHERE id = :id'), updates[i:i + batch_size])
+            conn.execute(db.text('ALTER TABLE payments DROP COLUMN amount_paid'))
+            converted += len(updates)
+
+        for table, column in (('payments', 'payment_date'), ('students', 'dob'), ('students', 'admission_date')):
+            if is_postgres:
+                # Normalize while the column is still text, then change its type.
+                data_type = conn.execute(db.text(
+                    'SELECT data_type FROM information_schema.columns '
+                    'WHERE table_schema = current_schema() AND table_name = :t AND column_name = :c'
+                ), {'t': table, 'c': column}).scalar()
+                if data_type == 'date':
+                    continue
+            rows = conn.execute(db.text(f'SELECT id, {column} AS value FROM {table} WHERE {column} IS NOT NULL')).fetchall()
+            updates, unreadable = [], []
+            for row in rows:
+                parsed = parse_date(row.value)
+                iso = parsed.isoformat() if parsed else None
+                if iso != row.value:
+                    updates.append({'id': row.id, 'value': iso})
+                if parsed is None and str(row.value).strip():
+                    # Cleared from the date column, but the original text is kept.
+                    unreadable.append({'table_name': table, 'row_id': row.id, 'column_name': column,
+                                       'raw_value': str(row.value)})
+            if unreadable:
+                conn.execute(LegacyValue.__table__.insert(), unreadable)
+                current_app.logger.warning('%d %s.%s values could not be read as dates; their text is kept in '
+                                           'legacy_values.', len(unreadable), table, column)
+            for i in range(0, len(updates), batch_size):
+                conn.execute(db.text(f'UPDATE {table} SET {column} = :value WHERE id = :id'), updates[i:i + batch_size])
+            if is_postgres:
+                conn.execute(db.text(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE DATE USING {column}::date'))
+            converted += len(updates)
+
+    # Indexes for date-range and per-period queries, and the payment event log.
+    db.metadata.create_all(engine)
+    for table in (Payment.__table__, Student.__table__, PaymentEvent.__table__):
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    # Superseded by ix_payment_events_student_amount, which starts with the same columns.
+    with engine.begin() as conn:
+        conn.execute(db.text('DROP INDEX IF EXISTS ix_payment_events_student'))
+
+    # Payments recorded before the event log existed get their 'created' event, dated by
+    # the payment; see UNKNOWN_PAYMENT_DATE for those without a readable date.
+    with engine.begin() as conn:
+        result = conn.execute(db.text('''
+            INSERT INTO payment_events (payment_id, student_reg_number, academic_year, term,
+                                        event_type, amount_kobo, recorded_by, recorded_at)
+            SELECT p.id, p.student_reg_number, p.academic_year, p.term, 'created', p.amount_kobo,
+                   p.recorded_by, COALESCE(p.payment_date, :unknown_date)
+            FROM payments p
+            WHERE NOT EXISTS (SELECT 1 FROM payment_events e WHERE e.payment_id = p.id)
+        ''').bindparams(db.bindparam('unknown_date', UNKNOWN_PAYMENT_DATE, type_=db.Date)))
+        converted += result.rowcount
+    return converted
+
+
+TERM_ORDER = ['First Term', 'Second Term', 'Third Term']
+
+
+def paid_by_period(reg_numbers):
+    """{reg_number: {(academic_year, term): kobo}} for many students in one grouped query."""
+    rows = db.session.query(
+        PaymentEvent.student_reg_number, PaymentEvent.academic_year, PaymentEvent.term,
+        db.func.sum(PaymentEvent.amount_kobo)
+    ).filter(PaymentEvent.student_reg_number.in_(reg_numbers)).group_by(
+        PaymentEvent.student_reg_number, PaymentEvent.academic_year, PaymentEvent.term
+    )
+    paid = {}
+    for reg_number, academic_year, term, kobo in rows:
+        paid.setdefault(reg_number, {})[(academic_year, term)] = kobo
+    return paid
+
+
+def build_fee_breakdown(student, paid, current_period):
+    """
+    Expected, paid and outstanding naira for each period the student was enrolled in,
+    paid anything for, or the current period; newest first. `paid` maps
+    (academic_year, term) to kobo, as returned by paid_by_period.
+    """
+    periods = set(paid) | {current_period}
+    if student.academic_year and student.term:
+        periods.add((student.academic_year, student.term))
+
+    def newest_first(period):
+        year, term = period
+        try:
+            start_year = int((year or '').split('/')[0])
+        except ValueError:
+            start_year = 0
+        return (start_year, TERM_ORDER.index(term) if term in TERM_ORDER else -1)
+
+    fee_breakdown = {}
+    for year, term in sorted(periods, key=newest_first, reverse=True):
+        expected = from_kobo(to_kobo(FEE_STRUCTURE.get((student.student_class, term), 0)))
+        total_paid = from_kobo(paid.get((year, term), 0))
+        fee_breakdown[f"{term} {year}"] = {
+            'expected': expected,
+            'paid': total_paid,
+            'outstanding': expected - total_paid
+        }
+    return fee_breakdown
+
+
+# Read-only roster projection for list pages: only the displayed columns, as immutable
+# RosterStudent tuples instead of ORM instances (no identity map, no attribute
+# instrumentation). fee_status is filled in per request from one grouped query.
+RosterStudent = namedtuple('RosterStudent', 'id reg_number name gender student_class term academic_year '
+                                            'admission_date fee_status')
+ROSTER_COLUMNS = (Student.id, Student.reg_number, Student.name, Student.gender, Student.student_class,
+                  Student.term, Student.academic_year, Student.admission_date)
+
+
+class RosterCache:
+    """
+    Roster projections per (tenant, class, term), each stored with the 'students'
+    data_versions counter it was built at. Every Student write bumps that counter in the
+    same transaction (bump_data_versions), so a write from any worker process makes the
+    entries stale; they are rebuilt on next use. Least recently used entries are dropped.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fetch(self, key, version, build):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                metrics.cache_lookup('roster', True)
+                return entry[1]
+        metrics.cache_lookup('roster', False)
+        value = build()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def roster(student_class=None, term=None):
+    """RosterStudent records (fee_status None) for a class and/or term, by name, cached."""
+    # Read the version before the rows: a write in between only makes the entry stale early.
+    version, = data_versions('students')
+
+    def build():
+        query = db.session.query(*ROSTER_COLUMNS)
+        if student_class is not None:
+            query = query.filter(Student.student_class == student_class)
+        if term is not None:
+            query = query.filter(Student.term == term)
+        return tuple(RosterStudent(*row, None) for row in query.order_by(Student.name))
+
+    key = (db.session.info.get('tenant'), student_class, term)
+    return current_app.extensions['roster_cache'].fetch(key, version, build)
+
+
+def roster_options():
+    """(classes, terms) that students are enrolled in, for the list filters; cached like roster()."""
+    version, = data_versions('students')
+
+    def build():
+        classes = sorted(c for c, in db.session.query(Student.student_class).distinct() if c is not None)
+        terms = sorted(t for t, in db.session.query(Student.term).distinct() if t is not None)
+        return classes, terms
+
+    key = (db.session.info.get('tenant'), 'options')
+    return current_app.extensions['roster_cache'].fetch(key, version, build)
+
+
+def with_fee_status(records, academic_year, term):
+    """Copies of roster records with fee_status set as get_fee_status would, in one query."""
+    paid = dict(db.session.query(PaymentEvent.student_reg_number, db.func.sum(PaymentEvent.amount_kobo)).filter(
+        PaymentEvent.academic_year == academic_year, PaymentEvent.term == term
+    ).group_by(PaymentEvent.student_reg_number).all())
+    expected_by_class = {}
+    result = []
+    for record in records:
+        expected = expected_by_class.get(record.student_class)
+        if expected is None:
+            expected = expected_by_class[record.student_class] = to_kobo(
+                FEE_STRUCTURE.get((record.student_class, term), 0))
+        if expected <= 0:
+            status = 'N/A'
+        elif paid.get(record.reg_number, 0) >= expected:
+            status = 'Paid'
+        else:
+            status = 'Defaulter'
+        result.append(record._replace(fee_status=status))
+    return result
+
+
+def analytics_cells(academic_years):
+    """
+    (class, academic_year, term, kobo paid) for every student and period in academic_years
+    that had a payment, plus each student's enrollment and current period (paid 0 if
+    nothing was paid), matching the periods build_fee_breakdown shows on a statement.
+    """
+    # Grouped on the covering (student, year, term, amount) index, without a join: the
+    # students are read once below anyway.
+    paid = db.session.query(
+        PaymentEvent.student_reg_number, PaymentEvent.academic_year, PaymentEvent.term,
+        db.func.sum(PaymentEvent.amount_kobo)
+    ).filter(PaymentEvent.academic_year.in_(academic_years)).group_by(
+        PaymentEvent.student_reg_number, PaymentEvent.academic_year, PaymentEvent.term
+    ).all()
+    students = db.session.query(Student.reg_number, Student.student_class, Student.academic_year, Student.term).all()
+    class_of = {reg_number: student_class for reg_number, student_class, _, _ in students}
+    cells = [(class_of[reg_number], year, term, kobo)
+             for reg_number, year, term, kobo in paid if reg_number in class_of]
+    seen = {(reg_number, year, term) for reg_number, year, term, _ in paid}
+    current_year, current_term = get_current_school_period()
+    for reg_number, student_class, year, term in students:
+        for period in {(current_year, current_term), (year, term)}:
+            if period[0] in academic_years and period[1] and (reg_number, *period) not in seen:
+                cells.append((student_class, *period, 0))
+    return cells
+
+
+class AnalyticsCache:
+    """
+    Built /analytics reports per (tenant, years, current period), each stored with the time
+    it was last checked and the 'students' and 'payments' data_versions it was built at. A
+    report younger than ttl_seconds is served as is; an older one only if those counters
+    haven't moved. Least recently used entries are dropped.
+    """
+    def __init__(self, ttl_seconds, max_entries=64):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fetch(self, key, versions, build):
+        """versions() reads the counters; build() makes the report when the cached one is stale."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                metrics.cache_lookup('analytics', True)
+                return entry[2]
+        current = versions()
+        with self._lock:
+            if entry is not None and entry[1] == current:
+                self._entries[key] = (now, current, entry[2])
+                self._entries.move_to_end(key)
+                metrics.cache_lookup('analytics', True)
+                return entry[2]
+        metrics.cache_lookup('analytics', False)
+        value = build()
+        with self._lock:
+            self._entries[key] = (now, current, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+def fee_analytics(years):
+    """
+    The app.analytics report for the last `years` academic years, cached per tenant and
+    current school period (see AnalyticsCache).
+    """
+    from app.analytics import report
+
+    current_year, current_term = get_current_school_period()
+
+    def build():
+        start = int(current_year.split('/')[0])
+        academic_years = [f'{y}/{y + 1}' for y in range(start - years + 1, start + 1)]
+        fees = {period: to_kobo(amount) for period, amount in FEE_STRUCTURE.items()}
+        return report(analytics_cells(academic_years), fees, (current_year, current_term))
+
+    key = (db.session.info.get('tenant'), years, current_year, current_term)
+    return current_app.extensions['analytics_cache'].fetch(
+        key, lambda: data_versions('students', 'payments'), build)
+
+
+def _student_dict(student):
+    return {'reg_number': student.reg_number, 'name': student.name, 'student_class': student.student_class}
+
+
+def receipt_data(payment):
+    student = Student.query.filter_by(reg_number=payment.student_reg_number).first()
+    period_paid = from_kobo(total_paid_kobo(payment.student_reg_number, payment.academic_year, payment.term))
+    if student is None:
+        # The student record was deleted; the payment still has a receipt, by reg number.
+        # Without a class there is no expected fee, so nothing can be said to be outstanding.
+        student_info = {'reg_number': payment.student_reg_number, 'name': 'Student record deleted',
+                        'student_class': 'Unknown'}
+        outstanding = None
+    else:
+        student_info = _student_dict(student)
+        outstanding = from_kobo(to_kobo(FEE_STRUCTURE.get((student.student_class, payment.term), 0))) - period_paid
+    return {
+        'student': student_info,
+        'payment': {'id': payment.id, 'term': payment.term, 'academic_year': payment.academic_year,
+                    'payment_date': payment.payment_date, 'amount': payment.amount_paid,
+                    'version': payment.version},
+        'period': {'paid': period_paid, 'outstanding': outstanding},
+    }
+
+
+def class_statements(student_class, academic_year, term):
+    """
+    Statement data for every student in a class, fetched with a single query: students
+    left-joined to their per-period payment totals. The totals only add up the class's own
+    events (through the student index), not the whole school's.
+    """
+    in_class = db.select(Student.reg_number).where(Student.student_class == student_class)
+    totals = db.session.query(
+        PaymentEvent.student_reg_number.label('reg_number'), PaymentEvent.academic_year, PaymentEvent.term,
+        db.func.sum(PaymentEvent.amount_kobo).label('kobo')
+    ).filter(PaymentEvent.student_reg_number.in_(in_class)).group_by(
+        PaymentEvent.student_reg_number, PaymentEvent.academic_year, PaymentEvent.term).subquery()
+    rows = db.session.query(Student, totals.c.academic_year, totals.c.term, totals.c.kobo).outerjoin(
+        totals, totals.c.reg_number == Student.reg_number
+    ).filter(Student.student_class == student_class).order_by(Student.name)
+
+    students, paid = {}, {}
+    for student, year, period_term, kobo in rows:
+        students[student.reg_number] = student
+        if kobo is not None:
+            paid.setdefault(student.reg_number, {})[(year, period_term)] = kobo
+    return [{
+        'student': _student_dict(student),
+        'academic_year': academic_year,
+        'term': term,
+        'fee_breakdown': build_fee_breakdown(student, paid.get(reg_number, {}), (academic_year, term)),
+    } for reg_number, student in students.items()]
+
+
+def read_replica(view):
+    """
+    Marks a view as read-only so its queries go to the replica bind, if one is configured.
+    Users who wrote something in the last DB_REPLICA_STICKY_SECONDS keep reading from the
+    primary so they see their own payment or student change despite replication lag.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        last_write = session.get('_last_write_at', 0)
+        sticky_seconds = current_app.config['DB_REPLICA_STICKY_SECONDS']
+        if datetime.now().timestamp() - last_write >= sticky_seconds:
+            db.session.info['read_only'] = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def conditional_view(scopes):
+    """
+    Answers GET requests with a weak ETag built from the data_versions counters that
+    scopes(**view_kwargs) names, plus the user, query string and current term. A
+    matching If-None-Match gets a 304 before the view runs any of its own queries.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            scope_names = scopes(**kwargs)
+            key = '|'.join([
+                str(g.get('tenant')), request.path, request.query_string.decode(), str(current_user.get_id()),
+                *get_current_school_period(), *map(str, data_versions(*scope_names)),
+            ])
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            # Pending flash messages are part of the page, so never skip rendering them.
+            if request.if_none_match.contains_weak(etag) and not session.get('_flashes'):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapped
+    return decorator
+
+
+def note_write():
+    session['_last_write_at'] = datetime.now().timestamp()
+
+
+def _engine_options(url, prefix):
+    """
+    Engine options for one bind from DB_* environment variables; the replica reads
+    DB_REPLICA_* first and falls back to the primary's DB_* setting.
+    """
+    def setting(name, default):
+        value = os.environ.get(f'{prefix}{name}')
+        if value is None:
+            value = os.environ.get(f'DB_{name}', default)
+        return value
+
+    options = {'pool_pre_ping': setting('POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes')}
+    pool_size = setting('POOL_SIZE', None)
+    if pool_size is not None:
+        options['pool_size'] = int(pool_size)
+        options['max_overflow'] = int(setting('MAX_OVERFLOW', '5'))
+        options['pool_timeout'] = int(setting('POOL_TIMEOUT', '30'))
+    timeout_ms = setting('STATEMENT_TIMEOUT_MS', None)
+    if timeout_ms is not None:
+        if url.startswith('postgresql'):
+            options['connect_args'] = {'options': f'-c statement_timeout={int(timeout_ms)}'}
+        elif url.startswith('sqlite'):
+            # SQLite has no statement timeout; the closest is how long to wait on a locked file.
+            options['connect_args'] = {'timeout': int(timeout_ms) / 1000}
+    return options
+
+
+def _database_url(value):
+    return value.replace("postgresql://", "postgresql+psycopg2://", 1)
+
+
+# Campuses (tenants). Each has its own SQLite file, or its own schema in one Postgres
+# database, and every request for a campus is routed to it by RoutingSession.
+TENANT_SLUG = re.compile(r'^[a-z0-9][a-z0-9-]{0,62}$')
+# Endpoints that also work without a campus, against the operator's own database.
+TENANTLESS_ENDPOINTS = {'login', 'logout', 'create_first_admin', 'campus_report_view', 'static',
+                        *metrics.HEALTH_ENDPOINTS}
+
+
+class TenantEngines:
+    """
+    Engines for tenant databases, created on first use and kept in a bounded LRU so a
+    deployment with many campuses doesn't hold a connection pool open for each of them.
+    An evicted engine is disposed; connections checked out at the time finish normally.
+    """
+    def __init__(self, url_template, max_engines, engine_options=None):
+        self.url_template = url_template
+        self.max_engines = max_engines
+        self.engine_options = engine_options or {}
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def url(self, tenant):
+        return self.url_template.format(tenant=tenant)
+
+    def schema(self, tenant):
+        """Postgres schema for a tenant, when all tenants share one database URL."""
+        if '{tenant}' in self.url_template or not self.url_template.startswith('postgresql'):
+            return None
+        return 'tenant_' + tenant.replace('-', '_')
+
+    def _create(self, tenant):
+        url = self.url(tenant)
+        options = dict(self.engine_options)
+        schema = self.schema(tenant)
+        if schema:
+            connect_args = dict(options.get('connect_args', {}))
+            connect_args['options'] = f"{connect_args.get('options', '')} -c search_path={schema}".strip()
+            options['connect_args'] = connect_args
+        elif url.startswith('sqlite:///'):
+            os.makedirs(os.path.dirname(os.path.abspath(url[len('sqlite:///'):])), exist_ok=True)
+        return create_engine(url, **options)
+
+    def get(self, tenant):
+        with self._lock:
+            engine = self._engines.get(tenant)
+            metrics.cache_lookup('tenant_engines', engine is not None)
+            if engine is not None:
+                self._engines.move_to_end(tenant)
+                return engine
+            engine = self._engines[tenant] = self._create(tenant)
+            while len(self._engines) > self.max_engines:
+                _, evicted = self._engines.popitem(last=False)
+                evicted.dispose()
+            return engine
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+
+class TenantMiddleware:
+    """
+    Works out the campus from the subdomain (<tenant>.TENANT_BASE_DOMAIN) or the first
+    path segment (/<tenant>/students). In path mode the segment is moved to SCRIPT_NAME,
+    so routes stay as they are and url_for() keeps generating links inside the campus.
+    """
+    def __init__(self, wsgi_app, tenants, resolution, base_domain=None):
+        self.wsgi_app = wsgi_app
+        self.tenants = set(tenants)
+        self.resolution = resolution
+        self.base_domain = (base_domain or '').lower()
+
+    def __call__(self, environ, start_response):
+        tenant = None
+        if self.resolution == 'subdomain':
+            host = environ.get('HTTP_HOST', '').split(':')[0].lower()
+            if self.base_domain and host.endswith('.' + self.base_domain):
+                # Unknown campuses are kept so the app can answer 404 rather than the operator site.
+                tenant = host[:-len(self.base_domain) - 1]
+        else:
+            path = environ.get('PATH_INFO', '')
+            segment, _, rest = path.lstrip('/').partition('/')
+            if segment in self.tenants:
+                tenant = segment
+                environ['SCRIPT_NAME'] = f"{environ.get('SCRIPT_NAME', '')}/{segment}"
+                environ['PATH_INFO'] = '/' + rest
+        environ['alfurqan.tenant'] = tenant
+        return self.wsgi_app(environ, start_response)
+
+
+def use_tenant(tenant):
+    """Routes db.session to a tenant's database for the rest of the app context."""
+    if tenant is not None and tenant not in current_app.config['TENANTS']:
+        raise ValueError(f'Unknown tenant {tenant!r}')
+    db.session.info['tenant'] = tenant
+
+
+def current_engine():
+    """The engine db.session writes to: the current campus's database, or the main one."""
+    tenant = db.session.info.get('tenant')
+    if tenant is None:
+        return db.engine
+    return current_app.extensions['tenant_engines'].get(tenant)
+
+
+def tenant_option(command):
+    """Adds --tenant to a CLI command, so its queries run against that campus's database."""
+    @click.option('--tenant', default=None, help='Campus to run against (default: the main database).')
+    @wraps(command)
+    def wrapped(*args, tenant=None, **kwargs):
+        use_tenant(tenant)
+        return command(*args, **kwargs)
+    return wrapped
+
+
+def create_tenant_schema(tenant):
+    """Creates a tenant's tables (and Postgres schema) if they don't exist yet."""
+    registry = current_app.extensions['tenant_engines']
+    engine = registry.get(tenant)
+    schema = registry.schema(tenant)
+    if schema:
+        with engine.begin() as connection:
+            connection.execute(db.text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+    db.metadata.create_all(engine)
+
+
+def campus_summary(engine, academic_year, term):
+    """Students, expected and paid fees, and defaulters for one campus and term, in kobo."""
+    with SQLAlchemySession(engine) as shard:
+        students = shard.query(Student.reg_number, Student.student_class).all()
+        paid = dict(shard.query(PaymentEvent.student_reg_number, db.func.sum(PaymentEvent.amount_kobo)).filter(
+            PaymentEvent.academic_year == academic_year, PaymentEvent.term == term
+        ).group_by(PaymentEvent.student_reg_number).all())
+        payments = shard.query(db.func.count(Payment.id)).filter(
+            Payment.academic_year == academic_year, Payment.term == term).scalar()
+    expected_kobo = paid_kobo = defaulters = 0
+    for reg_number, student_class in students:
+        expected = to_kobo(FEE_STRUCTURE.get((student_class, term), 0))
+        expected_kobo += expected
+        paid_kobo += paid.get(reg_number, 0)
+        if expected > 0 and paid.get(reg_number, 0) < expected:
+            defaulters += 1
+    return {
+        'students': len(students),
+        'payments': payments,
+        'expected_kobo': expected_kobo,
+        'paid_kobo': paid_kobo,
+        'outstanding_kobo': expected_kobo - paid_kobo,
+        'defaulters': defaulters,
+    }
+
+
+def campus_report(academic_year, term, workers=None):
+    """
+    campus_summary for every tenant, queried in parallel (one thread per shard, up to
+    TENANT_REPORT_WORKERS). Returns {'campuses': {tenant: summary}, 'total': summary}.
+    """
+    tenants = current_app.config['TENANTS']
+    registry = current_app.extensions['tenant_engines']
+    workers = workers or current_app.config['TENANT_REPORT_WORKERS']
+
+    def summarize(tenant):
+        return campus_summary(registry.get(tenant), academic_year, term)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tenants)))) as pool:
+        campuses = dict(zip(tenants, pool.map(summarize, tenants)))
+    total = {key: sum(summary[key] for summary in campuses.values())
+             for key in ('students', 'payments', 'expected_kobo', 'paid_kobo', 'outstanding_kobo', 'defaulters')}
+    return {'campuses': campuses, 'total': total}
+
+
+def missing_schema(engine):
+    """Tables and columns the models map that the database behind `engine` lacks."""
+    inspector = db.inspect(engine)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            missing.append(table.name)
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(f'{table.name}.{column.name}' for column in table.columns if column.name not in existing)
+    return missing
+
+
+def readiness():
+    """
+    Checks behind /readyz: the main database and every campus database answer and have
+    every table and column the models map (`flask normalize-ledger [--tenant]` adds the
+    newer columns to an older database).
+    """
+    engines = {'': db.engine}
+    registry = current_app.extensions['tenant_engines']
+    engines.update((f'{tenant}:', registry.get(tenant)) for tenant in current_app.config['TENANTS'])
+    checks = {}
+    for prefix, engine in engines.items():
+        try:
+            missing = missing_schema(engine)
+        except SQLAlchemyError as e:
+            checks[f'{prefix}database'] = (False, str(e))
+            checks[f'{prefix}schema'] = (False, 'unknown')
+            continue
+        checks[f'{prefix}database'] = (True, 'ok')
+        checks[f'{prefix}schema'] = (not missing, f"missing {', '.join(missing)}" if missing else 'ok')
+    return checks
+
+
 def create_app():
-    app = Flask(__name__)
+    # The pages and assets live with the app package's, in app/templates and app/static.
+    app = Flask(__name__, template_folder='app/templates', static_folder='app/static')
     
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
     
     database_url = os.environ.get("DATABASE_URL")
     if database_url:
-        app.config['SQLALCHEMY_DATABASE_URI'] = database_url.replace("postgresql://", "postgresql+psycopg2://", 1)
+        app.config['SQLALCHEMY_DATABASE_URI'] = _database_url(database_url)
     else:
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///db.sqlite'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _engine_options(app.config['SQLALCHEMY_DATABASE_URI'], 'DB_PRIMARY_')
+
+    # Optional read replica for report and list pages (e.g. two SQLite files locally).
+    replica_url = os.environ.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        replica_url = _database_url(replica_url)
+        app.config['SQLALCHEMY_BINDS'] = {'replica': {'url': replica_url, **_engine_options(replica_url, 'DB_REPLICA_')}}
+    app.config['DB_REPLICA_STICKY_SECONDS'] = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', '10'))
+
+    # Campuses served by this deployment (comma-separated slugs); empty means a single school.
+    app.config['TENANTS'] = [t.strip() for t in os.environ.get('TENANTS', '').split(',') if t.strip()]
+    for tenant in app.config['TENANTS']:
+        if not TENANT_SLUG.match(tenant):
+            raise ValueError(f'Invalid tenant name {tenant!r}: use lowercase letters, digits and hyphens.')
+    # 'path' (/<tenant>/students) or 'subdomain' (<tenant>.TENANT_BASE_DOMAIN/students).
+    app.config['TENANT_RESOLUTION'] = os.environ.get('TENANT_RESOLUTION', 'path')
+    app.config['TENANT_BASE_DOMAIN'] = os.environ.get('TENANT_BASE_DOMAIN')
+    # One database per campus: a URL containing {tenant}, or one Postgres URL with a schema per campus.
+    app.config['TENANT_DATABASE_URL'] = _database_url(os.environ.get(
+        'TENANT_DATABASE_URL', 'sqlite:///' + os.path.join(app.instance_path, 'tenants', '{tenant}.sqlite')))
+    # Tenant engines (each with its own pool) kept open at once, least recently used dropped first.
+    app.config['TENANT_MAX_ENGINES'] = int(os.environ.get('TENANT_MAX_ENGINES', '16'))
+    app.config['TENANT_REPORT_WORKERS'] = int(os.environ.get('TENANT_REPORT_WORKERS', '8'))
+    # Seconds a computed /analytics report is served before checking for new data.
+    app.config['ANALYTICS_CACHE_SECONDS'] = int(os.environ.get('ANALYTICS_CACHE_SECONDS', '300'))
+    # Processes used to render a class's statements; 0 means one per core.
+    app.config['STATEMENT_PROCESSES'] = int(os.environ.get('STATEMENT_PROCESSES', '0')) or None
+    # Every worker writes its metrics here and /metrics adds them up; set it empty to turn
+    # them off. Empty the directory when the server starts so the totals begin from zero.
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics')) or None
+    # Who may scrape /metrics: comma-separated addresses or networks, or anyone sending
+    # "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+    app.config['METRICS_ALLOWED_IPS'] = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') or None
+    # Text responses smaller than this aren't worth compressing.
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', '6'))
+    # Compiled templates are cached on disk and shared by every worker; set it empty to disable.
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get(
+        'TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache')) or None
+    # Compile every template in create_app() so a --preload master shares them with its workers.
+    app.config['TEMPLATE_PRELOAD'] = os.environ.get('TEMPLATE_PRELOAD', '1') == '1'
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
     # Initialize extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    if not os.environ.get('ALFURQAN_DESKTOP'):
+        # Flask-Migrate pulls in Alembic and Mako (about half a second of imports); it is
+        # only needed for `flask db` commands, never in the desktop build.
+        from flask_migrate import Migrate
+        Migrate(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'login'
-    
+    metrics.init_app(app, readiness)
+    # Compressed responses, and hashed static URLs served with immutable caching.
+    compression.init_app(app)
+    # The bytecode cache, the format_currency filter and render timing, as in the app package.
+    init_templates(app)
+
+    app.extensions['tenant_engines'] = TenantEngines(
+        app.config['TENANT_DATABASE_URL'], app.config['TENANT_MAX_ENGINES'],
+        _engine_options(app.config['TENANT_DATABASE_URL'], 'DB_TENANT_'))
+    if app.config['TENANTS']:
+        app.wsgi_app = TenantMiddleware(app.wsgi_app, app.config['TENANTS'],
+                                        app.config['TENANT_RESOLUTION'], app.config['TENANT_BASE_DOMAIN'])
+
+    @app.before_request
+    def resolve_tenant():
+        g.tenant = request.environ.get('alfurqan.tenant')
+        if not app.config['TENANTS']:
+            return
+        if g.tenant is None and request.endpoint not in TENANTLESS_ENDPOINTS:
+            abort(404)
+        if g.tenant is not None and g.tenant not in app.config['TENANTS']:
+            abort(404)
+        use_tenant(g.tenant)
+
     @login_manager.user_loader
     def load_user(user_id):
+        # Users belong to one campus database; a login doesn't carry over to another campus.
+        if session.get('_tenant') != g.get('tenant'):
+            return None
         return User.query.get(int(user_id))
-    
-    app.jinja_env.filters['format_currency'] = format_currency_filter
+
+    from app.idempotency import RecentKeys, new_key
+    app.extensions['recent_payments'] = RecentKeys()
+    app.extensions['roster_cache'] = RosterCache()
+    app.extensions['analytics_cache'] = AnalyticsCache(app.config['ANALYTICS_CACHE_SECONDS'])
+
+    def recorded_payment_id(idempotency_key):
+        """Id of the payment already recorded with this key, if any."""
+        payment_id = app.extensions['recent_payments'].get((g.tenant, idempotency_key))
+        if payment_id is None:
+            payment_id = db.session.query(Payment.id).filter_by(idempotency_key=idempotency_key).scalar()
+        return payment_id
+
+    @app.cli.command('normalize-ledger')
+    @tenant_option
+    def normalize_ledger_command():
+        """Migrate legacy text dates and float amounts to DATE and integer kobo columns."""
+        converted = normalize_legacy_columns(current_engine())
+        click.echo(f'Normalized {converted} values.')
+
+    @app.cli.command('statements')
+    @tenant_option
+    @click.argument('student_class')
+    @click.option('--format', 'fmt', type=click.Choice(['pdf', 'html']), default='pdf')
+    @click.option('--academic-year', default=None)
+    @click.option('--term', default=None)
+    @click.option('--processes', type=int, default=None, help='Worker processes (default: all cores).')
+    @click.option('--out', default=None, help='Zip file to write.')
+    def statements_command(student_class, fmt, academic_year, term, processes, out):
+        """Render term statements for a whole class into a zip bundle."""
+        from app.statements import render_bundle
+
+        current_academic_year, current_term = get_current_school_period()
+        academic_year, term = academic_year or current_academic_year, term or current_term
+        statements = class_statements(student_class, academic_year, term)
+        # HTML statements are page templates, whose layout builds URLs.
+        with app.test_request_context():
+            bundle, per_second = render_bundle(statements, fmt, processes=processes)
+        out = out or f"statements-{student_class.replace(' ', '')}-{term.replace(' ', '')}.zip"
+        with open(out, 'wb') as f:
+            f.write(bundle)
+        click.echo(f'{len(statements)} statements written to {out} ({per_second:.1f} statements/s).')
+
+    @app.cli.command('snapshot-balances')
+    @tenant_option
+    def snapshot_balances_command():
+        """Compact current per-student balances into a snapshot (run nightly or weekly)."""
+        entries = take_balance_snapshot()
+        click.echo(f'Snapshot of {entries} balances taken.')
+
+    @app.cli.command('init-tenants')
+    @click.argument('tenants', nargs=-1)
+    def init_tenants_command(tenants):
+        """Create the tables for the given campuses (default: every campus in TENANTS)."""
+        for tenant in tenants or app.config['TENANTS']:
+            if tenant not in app.config['TENANTS']:
+                raise click.BadParameter(f'{tenant!r} is not listed in TENANTS.')
+            create_tenant_schema(tenant)
+            click.echo(f'{tenant}: {app.extensions["tenant_engines"].url(tenant)}')
+
+    @app.cli.command('campus-report')
+    @click.option('--academic-year', default=None)
+    @click.option('--term', default=None)
+    def campus_report_command(academic_year, term):
+        """Fees expected and paid for the term on every campus, queried in parallel."""
+        current_academic_year, current_term = get_current_school_period()
+        report = campus_report(academic_year or current_academic_year, term or current_term)
+        for tenant, summary in [*report['campuses'].items(), ('total', report['total'])]:
+            click.echo(f"{tenant:20s} students {summary['students']:6d}  defaulters {summary['defaulters']:6d}  "
+                       f"paid {format_currency(from_kobo(summary['paid_kobo'])):>16s}  "
+                       f"outstanding {format_currency(from_kobo(summary['outstanding_kobo'])):>16s}")
 
     @app.route('/create_first_admin')
     def create_first_admin():
@@ -180,6 +1248,8 @@ def create_app():
 
     @app.route('/')
     @login_required
+    @read_replica
+    @conditional_view(lambda: ('students', 'payments'))
     def index():
         students = Student.query.order_by(Student.admission_date.desc()).limit(5).all()
         current_academic_year, current_term = get_current_school_period()
@@ -192,8 +1262,10 @@ def create_app():
 
     @app.route('/login', methods=['GET', 'POST'])
     def login():
+        # Without a campus, the operator's admins land on the cross-campus report.
+        home = 'campus_report_view' if app.config['TENANTS'] and g.tenant is None else 'index'
         if current_user.is_authenticated:
-            return redirect(url_for('index'))
+            return redirect(url_for(home))
             
         if request.method == 'POST':
             username = request.form['username']
@@ -201,8 +1273,9 @@ def create_app():
             user = User.query.filter_by(username=username).first()
             if user and check_password_hash(user.password, password):
                 login_user(user)
+                session['_tenant'] = g.tenant
                 flash('Login successful!', 'success')
-                return redirect(url_for('index'))
+                return redirect(url_for(home))
             else:
                 flash('Invalid username or password.', 'error')
         return render_template('login.html')
@@ -240,7 +1313,7 @@ def create_app():
         if request.method == 'POST':
             reg_number = request.form['reg_number'].strip()
             name = request.form['name'].strip()
-            dob = request.form['dob'].strip()
+            dob = parse_date(request.form['dob'])
             gender = request.form['gender'].strip()
             address = request.form['address'].strip()
             phone = request.form['phone'].strip()
@@ -248,7 +1321,7 @@ def create_app():
             student_class = request.form['class'].strip()
             term = request.form['term'].strip()
             academic_year = request.form['academic_year'].strip()
-            admission_date = datetime.now().strftime('%Y-%m-%d')
+            admission_date = date.today()
             
             existing_student = Student.query.filter_by(reg_number=reg_number).first()
             if existing_student:
@@ -270,6 +1343,7 @@ def create_app():
                     )
                     db.session.add(new_student)
                     db.session.commit()
+                    note_write()
                     flash(f'Student {name} registered successfully!', 'success')
                     return redirect(url_for('student_details', reg_number=reg_number))
                 except Exception as e:
@@ -286,34 +1360,28 @@ def create_app():
     @app.route('/students', defaults={'student_class': None})
     @app.route('/students/<student_class>')
     @login_required
+    @read_replica
+    @conditional_view(lambda student_class: ('students', 'payments'))
     def student_list(student_class):
         status_filter = request.args.get('status', 'all')
         class_filter = student_class or request.args.get('class', 'all')
         term_filter = request.args.get('term', 'all')
         search_query = request.args.get('search_query', '').strip()
 
-        query = Student.query
-
+        students_data = roster(None if class_filter == 'all' else class_filter,
+                               None if term_filter == 'all' else term_filter)
         if search_query:
-            query = query.filter(db.or_(Student.name.like(f'%{search_query}%'), Student.reg_number.like(f'%{search_query}%')))
-        if class_filter != 'all' and class_filter is not None:
-            query = query.filter_by(student_class=class_filter)
-        if term_filter != 'all':
-            query = query.filter_by(term=term_filter)
+            needle = search_query.casefold()
+            students_data = [s for s in students_data
+                             if needle in s.name.casefold() or needle in s.reg_number.casefold()]
 
-        students_data = query.order_by(Student.name).all()
-        
         current_academic_year, current_term_for_status = get_current_school_period()
-        students_with_status = []
-        for student in students_data:
-            student.fee_status = get_fee_status(student.reg_number, current_academic_year, current_term_for_status)
-            students_with_status.append(student)
+        students_with_status = with_fee_status(students_data, current_academic_year, current_term_for_status)
 
         if status_filter != 'all':
             students_with_status = [s for s in students_with_status if s.fee_status == status_filter]
 
-        all_classes = sorted(list(set(s.student_class for s in Student.query.all())))
-        all_terms = sorted(list(set(s.term for s in Student.query.all())))
+        all_classes, all_terms = roster_options()
 
         return render_template(
             'student_list.html',
@@ -328,6 +1396,8 @@ def create_app():
 
     @app.route('/student/<reg_number>')
     @login_required
+    @read_replica
+    @conditional_view(lambda reg_number: (f'student:{reg_number}',))
     def student_details(reg_number):
         student = Student.query.filter_by(reg_number=reg_number).first()
         if student is None:
@@ -342,60 +1412,14 @@ def create_app():
         current_academic_year, current_term = get_current_school_period()
         student_fee_status = get_fee_status(reg_number, current_academic_year, current_term)
         
-        fee_breakdown = {}
-        all_years_terms = set()
-        
-        if student.academic_year and student.term:
-            all_years_terms.add((student.academic_year, student.term))
-        for p in payments:
-            all_years_terms.add((p.academic_year, p.term))
-        all_years_terms.add((current_academic_year, current_term))
-        
-        for year, term in sorted(list(all_years_terms)):
-            expected_fee_key = (student.student_class, term)
-            expected_amount = FEE_STRUCTURE.get(expected_fee_key, 0.0)
-
-            total_paid_for_period = db.session.query(db.func.sum(Payment.amount_paid)).filter(
-                Payment.student_reg_number == reg_number,
-                Payment.term == term,
-                Payment.academic_year == year
-            ).scalar() or 0.0
-            
-            outstanding_amount = expected_amount - total_paid_for_period
-
-            fee_breakdown[f"{term} {year}"] = {
-                'expected': expected_amount,
-                'paid': total_paid_for_period,
-                'outstanding': outstanding_amount
-            }
-        
-        def sort_key_for_fee_breakdown(item):
-            period_str = item[0]
-            parts = period_str.split(' ')
-            term_name = ' '.join(parts[:-1]) if len(parts) > 1 else parts[0]
-            year_part = parts[-1] if len(parts) > 1 else ""
-            
-            try:
-                start_year = int(year_part.split('/')[0])
-            except (ValueError, IndexError):
-                start_year = 0
-            
-            term_order = ['First Term', 'Second Term', 'Third Term']
-            try:
-                term_index = term_order.index(term_name)
-            except ValueError:
-                term_index = -1
-            
-            return (start_year, term_index)
-
-        sorted_fee_breakdown = sorted(fee_breakdown.items(), key=sort_key_for_fee_breakdown, reverse=True)
-        sorted_fee_breakdown_dict = {k: v for k, v in sorted_fee_breakdown}
+        paid = paid_by_period([reg_number]).get(reg_number, {})
+        fee_breakdown = build_fee_breakdown(student, paid, (current_academic_year, current_term))
 
         return render_template('student_details.html',
                                student=student,
                                payments=payments,
                                fee_status=student_fee_status,
-                               fee_breakdown=sorted_fee_breakdown_dict,
+                               fee_breakdown=fee_breakdown,
                                current_academic_year=current_academic_year,
                                current_term=current_term
                                )
@@ -416,27 +1440,46 @@ def create_app():
             term = request.form['term'].strip()
             academic_year = request.form['academic_year'].strip()
             recorded_by_user = current_user.id
-            
+            # A double-click or browser retry resubmits the same key; show the first payment's receipt.
+            idempotency_key = request.form.get('idempotency_key') or None
+            if idempotency_key:
+                existing_id = recorded_payment_id(idempotency_key)
+                if existing_id:
+                    flash('This payment was already recorded.', 'info')
+                    return redirect(url_for('receipt', payment_id=existing_id))
+
             try:
-                amount_paid = float(amount_str)
+                amount_paid = from_kobo(to_kobo(amount_str))
                 if amount_paid <= 0:
                     flash('Payment amount must be positive.', 'error')
                 else:
-                    payment_date = datetime.now().strftime('%Y-%m-%d')
-                    new_payment = Payment(
+                    payment_date = date.today()
+                    new_payment = post_payment(
                         student_reg_number=reg_number,
                         term=term,
                         academic_year=academic_year,
                         amount_paid=amount_paid,
                         payment_date=payment_date,
-                        recorded_by=recorded_by_user
+                        recorded_by=recorded_by_user,
+                        idempotency_key=idempotency_key
                     )
-                    db.session.add(new_payment)
                     db.session.commit()
+                    metrics.payments_recorded('form', 1, new_payment.amount_kobo)
+                    if idempotency_key:
+                        app.extensions['recent_payments'].add((g.tenant, idempotency_key), new_payment.id)
+                    note_write()
                     flash(f'Payment of ₦{amount_paid:,.2f} recorded for {student.name} for {term} {academic_year}.', 'success')
-                    return redirect(url_for('student_details', reg_number=reg_number))
-            except ValueError:
+                    return redirect(url_for('receipt', payment_id=new_payment.id))
+            except (ValueError, ArithmeticError):
                 flash('Invalid amount. Please enter a valid number.', 'error')
+            except IntegrityError as e:
+                db.session.rollback()
+                existing_id = idempotency_key and recorded_payment_id(idempotency_key)
+                if existing_id:
+                    # A concurrent submit with the same key committed first.
+                    flash('This payment was already recorded.', 'info')
+                    return redirect(url_for('receipt', payment_id=existing_id))
+                flash(f'Database error: {e}', 'error')
             except Exception as e:
                 db.session.rollback()
                 flash(f'Database error: {e}', 'error')
@@ -449,11 +1492,137 @@ def create_app():
 
         return render_template('make_payment.html',
                                student=student,
+                               idempotency_key=new_key(),
                                terms=terms,
                                academic_years=academic_years,
                                pre_selected_term=pre_selected_term,
                                pre_selected_academic_year=pre_selected_academic_year)
 
+    @app.route('/receipt/<int:payment_id>')
+    @login_required
+    def receipt(payment_id):
+        from app.statements import receipt_html, receipt_pdf
+
+        payment = db.get_or_404(Payment, payment_id)
+        data = receipt_data(payment)
+        if request.args.get('format') == 'pdf':
+            return send_file(io.BytesIO(receipt_pdf(data)), mimetype='application/pdf',
+                             download_name=f'receipt-{payment_id}.pdf')
+        return receipt_html(data)
+
+    def change_payment(payment_id, done, change, *args):
+        """
+        Applies a reversal or correction posted for a payment. The form carries the version
+        of the payment the user was shown; if it has changed since, nothing is recorded and
+        the answer is 409, so they can reload and decide again.
+        """
+        if current_user.role != 'admin':
+            abort(403)
+        payment = db.get_or_404(Payment, payment_id)
+        try:
+            version = int(request.form['version'])
+        except (KeyError, ValueError):
+            abort(400, description='Post the version of the payment you were shown.')
+        note = request.form.get('note', '').strip() or None
+        try:
+            change(payment, *args, current_user.id, note, expected_version=version)
+            db.session.commit()
+        except (StaleDataError, ValueError) as e:
+            # Changed by someone else, or a reversal of a payment that is already reversed.
+            db.session.rollback()
+            abort(409, description=str(e))
+        note_write()
+        flash(done, 'success')
+        return redirect(url_for('receipt', payment_id=payment_id))
+
+    @app.route('/payment/<int:payment_id>/reverse', methods=['POST'])
+    @login_required
+    def payment_reverse(payment_id):
+        return change_payment(payment_id, f'Payment {payment_id} reversed.', reverse_payment)
+
+    @app.route('/payment/<int:payment_id>/correct', methods=['POST'])
+    @login_required
+    def payment_correct(payment_id):
+        try:
+            amount = from_kobo(to_kobo(request.form.get('amount_paid', '').strip()))
+        except ArithmeticError:
+            abort(400, description='Invalid amount. Please enter a valid number.')
+        if amount <= 0:
+            abort(400, description='Payment amount must be positive; reverse the payment to cancel it.')
+        return change_payment(payment_id, f'Payment {payment_id} corrected to ₦{amount:,.2f}.',
+                              correct_payment, amount)
+
+    @app.route('/statement/<reg_number>')
+    @login_required
+    @read_replica
+    def statement(reg_number):
+        from app.statements import statement_html, statement_pdf
+
+        student = Student.query.filter_by(reg_number=reg_number).first_or_404()
+        current_academic_year, current_term = get_current_school_period()
+        academic_year = request.args.get('academic_year', current_academic_year)
+        term = request.args.get('term', current_term)
+        data = {
+            'student': _student_dict(student),
+            'academic_year': academic_year,
+            'term': term,
+            'fee_breakdown': build_fee_breakdown(
+                student, paid_by_period([reg_number]).get(reg_number, {}), (academic_year, term)),
+        }
+        if request.args.get('format') == 'pdf':
+            return send_file(io.BytesIO(statement_pdf(data)), mimetype='application/pdf',
+                             download_name=f"statement-{reg_number.replace('/', '-')}.pdf")
+        return statement_html(data)
+
+    @app.route('/statements/<student_class>')
+    @login_required
+    @read_replica
+    def class_statement_bundle(student_class):
+        """Zip of term statements for a whole class (?format=pdf|html, ?academic_year, ?term)."""
+        from app.statements import render_bundle
+
+        if current_user.role != 'admin':
+            abort(403)
+        current_academic_year, current_term = get_current_school_period()
+        academic_year = request.args.get('academic_year', current_academic_year)
+        term = request.args.get('term', current_term)
+        fmt = request.args.get('format', 'pdf')
+        if fmt not in ('pdf', 'html'):
+            abort(400)
+        statements = class_statements(student_class, academic_year, term)
+        bundle, per_second = render_bundle(statements, fmt, processes=app.config['STATEMENT_PROCESSES'])
+        response = send_file(io.BytesIO(bundle), mimetype='application/zip', as_attachment=True,
+                             download_name=f"statements-{student_class.replace(' ', '')}-{term.replace(' ', '')}.zip")
+        response.headers['X-Statements-Per-Second'] = f'{per_second:.1f}'
+        return response
+
+    @app.route('/analytics')
+    @login_required
+    @read_replica
+    def analytics():
+        """Collection by class, term and year (?years=3, ?format=json)."""
+        from app.analytics import report_html
+
+        if current_user.role != 'admin':
+            abort(403)
+        years = min(max(request.args.get('years', 3, type=int), 1), 10)
+        data = fee_analytics(years)
+        if request.args.get('format') == 'json':
+            return data
+        return report_html(data)
+
+    @app.route('/reports/campuses')
+    @login_required
+    def campus_report_view():
+        """Cross-campus fee totals for the operator's admins (amounts in kobo)."""
+        if current_user.role != 'admin' or g.tenant is not None or not app.config['TENANTS']:
+            abort(404)
+        current_academic_year, current_term = get_current_school_period()
+        academic_year = request.args.get('academic_year', current_academic_year)
+        term = request.args.get('term', current_term)
+        report = campus_report(academic_year, term)
+        return {'academic_year': academic_year, 'term': term, **report}
+
     @app.route('/edit_student/<reg_number>', methods=['GET', 'POST'])
     @login_required
     def edit_student(reg_number):
@@ -464,7 +1633,7 @@ def create_app():
         if request.method == 'POST':
             try:
                 student.name = request.form['name'].strip()
-                student.dob = request.form['dob'].strip()
+                student.dob = parse_date(request.form['dob'])
                 student.gender = request.form['gender'].strip()
                 student.address = request.form['address'].strip()
                 student.phone = request.form['phone'].strip()
@@ -473,6 +1642,7 @@ def create_app():
                 student.term = request.form['term'].strip()
                 student.academic_year = request.form['academic_year'].strip()
                 db.session.commit()
+                note_write()
                 flash(f'Student {student.name} updated successfully!', 'success')
                 return redirect(url_for('student_details', reg_number=reg_number))
             except Exception as e:
@@ -488,9 +1658,29 @@ def create_app():
 
     return app
 
-app = create_app()
+_app = None
+
+
+def __getattr__(name):
+    # `app` is created on first access instead of at import time, so importing this
+    # module (or a worker forking from it) doesn't pay for create_app() until it is used.
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        # The desktop build (AlfurqanAcademy.spec) runs this file; desktop.py launches it.
+        import desktop
+        desktop.main()
+        sys.exit()
+    app = create_app()
     with app.app_context():
         db.create_all()
+        for tenant in app.config['TENANTS']:
+            create_tenant_schema(tenant)
     app.run(debug=True)
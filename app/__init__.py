@@ -1,8 +1,9 @@
 # app/__init__.py
 import os
 import sqlite3
-from flask import Flask, g
+from flask import Flask, g, current_app, abort, request
 from flask_bcrypt import Bcrypt
+from . import metrics
 
 bcrypt = Bcrypt()
 
@@ -10,8 +11,10 @@ bcrypt = Bcrypt()
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(os.path.join('instance', 'database.db'))
+        db = g._database = sqlite3.connect(current_app.config['DATABASE'], factory=metrics.MeteredConnection)
         db.row_factory = sqlite3.Row # Enable dictionary-like row access
+        metrics.inc('alfurqan_db_connections_opened_total')
+        metrics.inc('alfurqan_db_connections_open')
     return db
 
 # Helper function to close the database connection
@@ -19,15 +22,111 @@ def close_connection(exception):
     db = getattr(g, '_database', None)
     if db is not None:
         db.close()
+        metrics.inc('alfurqan_db_connections_open', -1)
 
-def create_app():
-    app = Flask(__name__, instance_relative_config=True)
+def init_templates(app):
+    from jinja2 import FileSystemBytecodeCache
+    from . import instrumentation
+    from .conversions import format_currency
+
+    cache_dir = app.config['TEMPLATE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Must be set before app.jinja_env is first used.
+        app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(cache_dir)}
+    app.jinja_env.filters['format_currency'] = format_currency
+    instrumentation.init_app(app)
+    if app.config['TEMPLATE_PRELOAD']:
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+
+def check_schema(app):
+    """
+    Boot-time schema check: one query for the version stored in the database. An out-of-date
+    database is migrated if DATABASE_AUTO_MIGRATE is set; otherwise requests get a 503 until
+    `flask init-db` has been run.
+    """
+    from . import models
+
+    with app.app_context():
+        current = models.schema_version(get_db())
+        if current < models.SCHEMA_VERSION and app.config['DATABASE_AUTO_MIGRATE']:
+            models.init_db()
+            current = models.SCHEMA_VERSION
+    if current >= models.SCHEMA_VERSION:
+        return
+
+    app.logger.warning('Database schema is at version %d, this code needs %d: run `flask init-db`.',
+                       current, models.SCHEMA_VERSION)
+    migrated = False
+
+    @app.before_request
+    def require_current_schema():
+        nonlocal migrated
+        if not migrated and request.endpoint not in metrics.HEALTH_ENDPOINTS:
+            migrated = models.schema_version(get_db()) >= models.SCHEMA_VERSION
+            if not migrated:
+                abort(503, description='The database needs migrating: run `flask init-db`.')
+
+def readiness():
+    """Checks behind /readyz: the database answers and its schema is current."""
+    from . import models
+
+    try:
+        version = models.schema_version(get_db())
+    except sqlite3.Error as e:
+        return {'database': (False, str(e)), 'schema': (False, 'unknown')}
+    return {
+        'database': (True, 'ok'),
+        'schema': (version >= models.SCHEMA_VERSION, f'version {version} of {models.SCHEMA_VERSION}'),
+    }
+
+def register_commands(app):
+    import click
+    from . import models
+
+    @app.cli.command('init-db')
+    @click.option('--seed/--no-seed', default=True, help='Create the default users if there are none.')
+    def init_db_command(seed):
+        """Apply pending schema migrations and record the new schema version."""
+        db = get_db()
+        before = models.schema_version(db)
+        applied = models.migrate(db)
+        if seed:
+            models.seed_default_users(db)
+        if applied:
+            click.echo(f'Migrated schema from version {before} to {applied[-1]}.')
+        else:
+            click.echo(f'Schema is up to date (version {before}).')
+
+def create_app(config=None, instance_path=None):
+    # The desktop build passes a per-user instance_path, since the bundle directory is temporary.
+    app = Flask(__name__, instance_relative_config=True, instance_path=instance_path)
     
     # Configure the app
     app.config.from_mapping(
         SECRET_KEY='dev',
-        DATABASE=os.path.join(app.instance_path, 'database.db')
+        DATABASE=os.path.join(app.instance_path, 'database.db'),
+        # Migrate an out-of-date database in create_app(). Meant for single-process use (the
+        # desktop build, `python run.py`); servers run `flask init-db` once per deploy instead.
+        DATABASE_AUTO_MIGRATE=False,
+        # Compiled templates are cached on disk and shared by every worker; set to None to disable.
+        TEMPLATE_CACHE_DIR=os.path.join(app.instance_path, 'jinja_cache'),
+        # Compile every template in create_app() so a --preload master shares them with its workers.
+        TEMPLATE_PRELOAD=True,
+        # Text responses smaller than this aren't worth compressing.
+        COMPRESS_MIN_SIZE=1024,
+        COMPRESS_LEVEL=6,
+        # Every worker writes its metrics here and /metrics adds them up; None turns them off.
+        # Empty it when the server starts so the totals begin from zero.
+        METRICS_DIR=os.path.join(app.instance_path, 'metrics'),
+        # Who may scrape /metrics: these addresses or networks, or anyone sending
+        # "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+        METRICS_ALLOWED_IPS=('127.0.0.1', '::1'),
+        METRICS_TOKEN=None,
     )
+    if config:
+        app.config.update(config)
 
     # Ensure the instance folder exists
     try:
@@ -41,12 +140,22 @@ def create_app():
     # Register the database connection teardown function
     app.teardown_appcontext(close_connection)
 
-    from . import models
-    with app.app_context():
-        models.init_db()
+    # Before the schema check, so its 503s are timed and /readyz can still answer.
+    metrics.init_app(app, readiness)
+    check_schema(app)
+
+    register_commands(app)
+    init_templates(app)
+
+    from . import compression, idempotency
+    compression.init_app(app)
+    idempotency.init_app(app)
 
     # Register the blueprint
     from .routes import main_bp
     app.register_blueprint(main_bp)
 
+    from .api import api_bp
+    app.register_blueprint(api_bp)
+
     return app
\ No newline at end of file
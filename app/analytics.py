@@ -0,0 +1,147 @@
+# app/analytics.py
+# Fee collection analytics by class, term and academic year. The caller supplies one cell
+# per student and period ((class, academic year, term, kobo paid)); they are packed once
+# into parallel typed arrays with small-integer codes for class and period, and every
+# report below is a single pass over those arrays into flat accumulators indexed by
+# class * periods + period. No ORM objects or per-row dicts, so a few hundred thousand
+# cells (about a million payments) aggregate in well under a second, and the finished
+# report is cached by the caller for its cache window.
+from array import array
+
+from flask import render_template
+
+TERM_ORDER = ('First Term', 'Second Term', 'Third Term')
+PERCENTILES = (50, 75, 90, 99)
+
+
+def _period_key(period):
+    year, term = period
+    try:
+        start_year = int((year or '').split('/')[0])
+    except ValueError:
+        start_year = 0
+    return start_year, TERM_ORDER.index(term) if term in TERM_ORDER else -1
+
+
+class Columns:
+    """Student-period cells as parallel arrays, with the code tables to decode them."""
+    __slots__ = ('classes', 'periods', 'class_code', 'period_code', 'paid', 'expected')
+
+    def __init__(self, cells, fees):
+        """cells: iterable of (class, academic_year, term, paid kobo); fees: {(class, term): kobo}."""
+        class_ids, period_ids = {}, {}
+        class_code, period_code = array('H'), array('H')
+        paid, expected = array('q'), array('q')
+        for student_class, academic_year, term, kobo in cells:
+            c = class_ids.get(student_class)
+            if c is None:
+                c = class_ids[student_class] = len(class_ids)
+            p = period_ids.get((academic_year, term))
+            if p is None:
+                p = period_ids[(academic_year, term)] = len(period_ids)
+            class_code.append(c)
+            period_code.append(p)
+            paid.append(kobo)
+            expected.append(fees.get((student_class, term), 0))
+        self.classes = list(class_ids)
+        self.periods = list(period_ids)
+        self.class_code, self.period_code = class_code, period_code
+        self.paid, self.expected = paid, expected
+
+    def __len__(self):
+        return len(self.paid)
+
+
+def pivot(columns):
+    """
+    Expected, received and outstanding kobo, student count and collection rate for every
+    (class, academic year, term), newest period first within each class.
+    """
+    width = len(columns.periods)
+    size = len(columns.classes) * width
+    students, expected, received, outstanding = [0] * size, [0] * size, [0] * size, [0] * size
+    for c, p, due, paid in zip(columns.class_code, columns.period_code, columns.expected, columns.paid):
+        i = c * width + p
+        students[i] += 1
+        expected[i] += due
+        received[i] += paid
+        if due > paid:
+            outstanding[i] += due - paid
+
+    order = sorted(range(width), key=lambda p: _period_key(columns.periods[p]), reverse=True)
+    rows = []
+    for c, student_class in sorted(enumerate(columns.classes), key=lambda item: item[1] or ''):
+        for p in order:
+            i = c * width + p
+            if not students[i]:
+                continue
+            academic_year, term = columns.periods[p]
+            rows.append({
+                'class': student_class, 'academic_year': academic_year, 'term': term,
+                'students': students[i], 'expected_kobo': expected[i], 'received_kobo': received[i],
+                'outstanding_kobo': outstanding[i],
+                'collection_rate': round(received[i] / expected[i], 4) if expected[i] else None,
+            })
+    return rows
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-q * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+
+def outstanding_distribution(columns, period=None):
+    """
+    Per class: how many students owe anything and percentiles of what they owe (kobo),
+    for one (academic_year, term) or across every period.
+    """
+    only = columns.periods.index(period) if period in columns.periods else None
+    if period is not None and only is None:
+        return {}
+    owed = [array('q') for _ in columns.classes]
+    counts = [0] * len(columns.classes)
+    for c, p, due, paid in zip(columns.class_code, columns.period_code, columns.expected, columns.paid):
+        if only is not None and p != only:
+            continue
+        counts[c] += 1
+        if due > paid:
+            owed[c].append(due - paid)
+    result = {}
+    for c, student_class in enumerate(columns.classes):
+        if not counts[c]:
+            continue
+        values = sorted(owed[c])
+        result[student_class] = {
+            'students': counts[c],
+            'owing': len(values),
+            'max_kobo': values[-1] if values else 0,
+            **{f'p{q}_kobo': percentile(values, q) for q in PERCENTILES},
+        }
+    return result
+
+
+def collection_trends(pivot_rows):
+    """{class: [(period label, collection rate), ...]} oldest first, from pivot() rows."""
+    trends = {}
+    for row in reversed(pivot_rows):
+        trends.setdefault(row['class'], []).append((f"{row['term']} {row['academic_year']}", row['collection_rate']))
+    return trends
+
+
+def report(cells, fees, current_period=None):
+    columns = Columns(cells, fees)
+    rows = pivot(columns)
+    return {
+        'cells': len(columns),
+        'pivot': rows,
+        'outstanding': outstanding_distribution(columns, current_period),
+        'trends': collection_trends(rows),
+        'current_period': list(current_period) if current_period else None,
+    }
+
+
+def report_html(data):
+    return render_template('analytics.html', report=data, percentiles=PERCENTILES)
@@ -0,0 +1,521 @@
+# app/api.py
+# Versioned JSON API for the bursar tablet app. Every list endpoint uses cursor (keyset)
+# pagination and accepts ?fields=a,b to trim columns and ?format=rows to send a field list
+# plus bare rows instead of repeating keys. Batch endpoints answer for many students or
+# accept many payments in one call using set-based queries.
+import base64
+import json
+import sqlite3
+from functools import wraps
+
+from flask import Blueprint, request, session, current_app
+from . import get_db, bcrypt
+from .conversions import to_kobo, from_kobo, normalize_date
+from . import ledger, metrics
+from .idempotency import is_repeat
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 1000
+# client_ids and Idempotency-Keys are one namespace for every device of the school, so they
+# must be unique everywhere (a UUID), not a per-device counter.
+CLIENT_ID_LENGTH = (16, 100)
+
+STUDENT_FIELDS = ('id', 'reg_number', 'name', 'class', 'term', 'academic_year')
+PAYMENT_FIELDS = ('id', 'student_reg_number', 'amount', 'payment_date', 'term', 'academic_year', 'recorded_by', 'version')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+@api_bp.errorhandler(ApiError)
+def handle_api_error(error):
+    payload = {'error': error.message}
+    if error.errors:
+        payload['errors'] = error.errors
+    return json_response(payload, error.status)
+
+
+def json_response(payload, status=200):
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False, default=str)
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def official_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if session.get('role') not in ('admin', 'official'):
+            raise ApiError('Authentication required.', 401)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def json_body():
+    """The request's JSON object, {} for an empty body; anything else (a list, a string, malformed JSON) is a 400."""
+    data = request.get_json(silent=True)
+    if data is None:
+        if request.get_data():
+            raise ApiError('Malformed JSON.')
+        return {}
+    if not isinstance(data, dict):
+        raise ApiError('Send a JSON object.')
+    return data
+
+
+def json_list(data, name):
+    value = data.get(name) or []
+    if not isinstance(value, list):
+        raise ApiError(f'{name} must be a list.')
+    return value
+
+
+def like_pattern(text):
+    """Escapes LIKE wildcards in user input; use with ESCAPE '\\'."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except ValueError:
+        raise ApiError('Invalid cursor.')
+
+
+def requested_fields(available):
+    fields = request.args.get('fields')
+    if not fields:
+        return available
+    chosen = tuple(f for f in fields.split(',') if f)
+    unknown = set(chosen) - set(available)
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return chosen
+
+
+def page_size():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be a number.')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def shape(records, fields):
+    """Objects by default; ?format=rows sends the field names once and rows as arrays."""
+    if request.args.get('format') == 'rows':
+        return {'fields': list(fields), 'rows': [[r[f] for f in fields] for r in records]}
+    return {'data': [{f: r[f] for f in fields} for r in records]}
+
+
+def paginated(sql, params, fields, limit, serialize=dict):
+    # Keyset pagination on id: stable while rows are inserted, and never an OFFSET scan.
+    rows = get_db().execute(f'{sql} ORDER BY id LIMIT ?', (*params, limit + 1)).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    payload = shape([serialize(row) for row in rows], fields)
+    payload['next_cursor'] = encode_cursor(rows[-1]['id']) if more else None
+    return json_response(payload)
+
+
+def chunks(items, size=500):
+    # SQLite limits the number of bound parameters per statement.
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def classify(total_fees, total_paid):
+    """Same rules as the admin dashboard."""
+    if total_fees - total_paid <= 0:
+        return 'Paid'
+    return 'Defaulter' if total_paid == 0 else 'Partially Paid'
+
+
+@api_bp.route('/login', methods=['POST'])
+def login():
+    data = json_body()
+    user = get_db().execute('SELECT * FROM users WHERE username = ?', (data.get('username'),)).fetchone()
+    if not user or not bcrypt.check_password_hash(user['password'], data.get('password') or ''):
+        raise ApiError('Invalid username or password.', 401)
+    session['user_id'] = user['id']
+    session['username'] = user['username']
+    session['role'] = user['role']
+    return json_response({'username': user['username'], 'role': user['role']})
+
+
+@api_bp.route('/students')
+@official_required
+def students():
+    fields = requested_fields(STUDENT_FIELDS)
+    sql = 'SELECT id, reg_number, name, class, term, academic_year FROM students WHERE id > ?'
+    params = [decode_cursor(request.args.get('cursor'))]
+    for column in ('class', 'term', 'academic_year'):
+        if request.args.get(column):
+            sql += f' AND {column} = ?'
+            params.append(request.args[column])
+    return paginated(sql, params, fields, page_size())
+
+
+@api_bp.route('/students/<path:reg_number>')
+@official_required
+def student(reg_number):
+    row = get_db().execute('SELECT id, reg_number, name, class, term, academic_year FROM students '
+                           'WHERE reg_number = ?', (reg_number,)).fetchone()
+    if row is None:
+        raise ApiError('Student not found.', 404)
+    fields = requested_fields(STUDENT_FIELDS)
+    return json_response({f: row[f] for f in fields})
+
+
+@api_bp.route('/search')
+@official_required
+def search():
+    query = request.args.get('q', '').strip()
+    if len(query) < 2:
+        raise ApiError('q must be at least 2 characters.')
+    fields = requested_fields(STUDENT_FIELDS)
+    sql = ('SELECT id, reg_number, name, class, term, academic_year FROM students '
+           "WHERE id > ? AND (name LIKE ? ESCAPE '\\' OR reg_number LIKE ? ESCAPE '\\')")
+    pattern = like_pattern(query)
+    return paginated(sql, [decode_cursor(request.args.get('cursor')), f'%{pattern}%', f'{pattern}%'],
+                     fields, page_size())
+
+
+def _payment(row):
+    record = dict(row)
+    record['amount'] = str(from_kobo(record.pop('amount_kobo')))
+    return record
+
+
+@api_bp.route('/payments')
+@official_required
+def payments():
+    fields = requested_fields(PAYMENT_FIELDS)
+    sql = ('SELECT id, student_reg_number, amount_kobo, payment_date, term, academic_year, recorded_by, version '
+           'FROM payments WHERE id > ?')
+    params = [decode_cursor(request.args.get('cursor'))]
+    for arg, column in (('student', 'student_reg_number'), ('term', 'term'), ('academic_year', 'academic_year')):
+        if request.args.get(arg):
+            sql += f' AND {column} = ?'
+            params.append(request.args[arg])
+    return paginated(sql, params, fields, page_size(), serialize=_payment)
+
+
+@api_bp.route('/fee-status', methods=['POST'])
+@official_required
+def fee_status_batch():
+    """
+    Fee status for many students at once: {"reg_numbers": [...]}. Two grouped queries per
+    chunk of reg numbers, however many students are asked for.
+    """
+    reg_numbers = json_list(json_body(), 'reg_numbers')
+    if not all(isinstance(reg_number, str) for reg_number in reg_numbers):
+        raise ApiError('reg_numbers must be strings.')
+    reg_numbers = list(dict.fromkeys(reg_numbers))
+    if not reg_numbers or len(reg_numbers) > MAX_BATCH_SIZE:
+        raise ApiError(f'Send between 1 and {MAX_BATCH_SIZE} reg_numbers.')
+
+    db = get_db()
+    expected, paid = {}, {}
+    for chunk in chunks(reg_numbers):
+        marks = ','.join('?' * len(chunk))
+        expected.update(db.execute(f'''
+            SELECT s.reg_number, COALESCE(SUM(f.amount_kobo), 0)
+            FROM students s LEFT JOIN fees f ON f.student_id = s.id
+            WHERE s.reg_number IN ({marks}) GROUP BY s.reg_number
+        ''', chunk).fetchall())
+        paid.update(db.execute(f'''
+            SELECT student_reg_number, SUM(amount_kobo) FROM payment_events
+            WHERE student_reg_number IN ({marks}) GROUP BY student_reg_number
+        ''', chunk).fetchall())
+
+    results = {}
+    for reg_number in reg_numbers:
+        if reg_number not in expected:
+            results[reg_number] = None
+            continue
+        total_fees, total_paid = expected[reg_number], paid.get(reg_number, 0)
+        results[reg_number] = {
+            'status': classify(total_fees, total_paid),
+            'expected': str(from_kobo(total_fees)),
+            'paid': str(from_kobo(total_paid)),
+            'outstanding': str(from_kobo(total_fees - total_paid)),
+        }
+    return json_response({'data': results})
+
+
+@api_bp.route('/payments/batch', methods=['POST'])
+@official_required
+def payments_batch():
+    """
+    Records many payments in one transaction: {"payments": [{student_reg_number, amount,
+    payment_date, term, academic_year, client_id}, ...]}. Either every payment is stored or
+    none is. A client_id that was already uploaded for the same student, amount and period
+    returns the existing payment's id; used for a different payment, it is a 409.
+    With an Idempotency-Key header, items without a client_id get one derived from the
+    key and their position, so retrying the same request never posts twice.
+    """
+    items = payment_items(json_body())
+    key = request.headers.get('Idempotency-Key')
+    if key:
+        if not valid_client_id(key):
+            raise ApiError('Idempotency-Key must be a unique string such as a UUID (16 to 100 characters).')
+        items = [dict(item, client_id=item.get('client_id') or f'{key}:{index}') for index, item in enumerate(items)]
+    ids, duplicates = record_payments(items)
+    return json_response({'ids': ids, 'duplicates': duplicates}, 201)
+
+
+# Types each payment field may have in JSON; anything else is rejected before validation.
+# A payment without a term and academic year would never count towards any fee.
+PAYMENT_REQUIRED_FIELDS = ('term', 'academic_year')
+PAYMENT_ITEM_TYPES = {
+    'student_reg_number': (str,),
+    'amount': (str, int, float),
+    'payment_date': (str,),
+    'term': (str,),
+    'academic_year': (str,),
+    'client_id': (str, type(None)),
+}
+
+
+def valid_client_id(value):
+    return CLIENT_ID_LENGTH[0] <= len(value.strip()) <= CLIENT_ID_LENGTH[1]
+
+
+def payment_items(data):
+    """The payments list of a batch or sync body; malformed items are a 400 naming each one."""
+    items = json_list(data, 'payments')
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'Each payment must be an object.'})
+            continue
+        wrong = [name for name, types in PAYMENT_ITEM_TYPES.items()
+                 if name in item and (not isinstance(item[name], types) or isinstance(item[name], bool))]
+        missing = [name for name in PAYMENT_REQUIRED_FIELDS if name not in wrong and not (item.get(name) or '').strip()]
+        if wrong:
+            errors.append({'index': index, 'error': f"Wrong type for {', '.join(wrong)}."})
+        elif missing:
+            errors.append({'index': index, 'error': f"Missing {', '.join(missing)}."})
+        elif item.get('client_id') and not valid_client_id(item['client_id']):
+            errors.append({'index': index, 'error': 'client_id must be a unique string such as a UUID '
+                                                    '(16 to 100 characters).'})
+    if errors:
+        raise ApiError('Some payments are malformed; nothing was recorded.', 400, errors)
+    return items
+
+
+def record_payments(items, retrying=False):
+    if not items or len(items) > MAX_BATCH_SIZE:
+        raise ApiError(f'Send between 1 and {MAX_BATCH_SIZE} payments.')
+
+    db = get_db()
+    reg_numbers = list({str(item.get('student_reg_number')) for item in items})
+    known = set()
+    for chunk in chunks(reg_numbers):
+        known.update(row[0] for row in db.execute(
+            f"SELECT reg_number FROM students WHERE reg_number IN ({','.join('?' * len(chunk))})", chunk))
+
+    # Payments recorded offline carry a client-generated id; re-uploads must not post twice.
+    # A re-upload is the same student, amount and period; anything else reusing the id is a
+    # different payment and must not be answered with this one's id.
+    client_ids = list({item['client_id'] for item in items if item.get('client_id')})
+    existing, recorded = {}, {}
+    for chunk in chunks(client_ids):
+        for client_id, payment_id, *payment in db.execute(
+                f"SELECT client_id, id, student_reg_number, amount_kobo, term, academic_year FROM payments "
+                f"WHERE client_id IN ({','.join('?' * len(chunk))})", chunk):
+            existing[client_id] = payment_id
+            recorded[client_id] = tuple(payment)
+
+    rows, errors, conflicts = [], [], []
+    for index, item in enumerate(items):
+        client_id = item.get('client_id') or None
+        try:
+            amount_kobo = to_kobo(item.get('amount'))
+        except ArithmeticError:
+            amount_kobo = 0
+        payment = (item.get('student_reg_number'), amount_kobo, item['term'], item['academic_year'])
+        if client_id in recorded:
+            if recorded[client_id] != payment:
+                conflicts.append({'index': index, 'error': 'client_id was already used for a different payment.'})
+            continue
+        payment_date = normalize_date(item.get('payment_date'))
+        if str(item.get('student_reg_number')) not in known:
+            errors.append({'index': index, 'error': 'Unknown student_reg_number.'})
+        elif amount_kobo <= 0 or payment_date is None:
+            errors.append({'index': index, 'error': 'amount must be positive and payment_date valid.'})
+        else:
+            if client_id:
+                recorded[client_id] = payment
+            rows.append((item['student_reg_number'], amount_kobo, payment_date,
+                         item['term'], item['academic_year'], session.get('username'), client_id))
+    if conflicts:
+        raise ApiError('Some client_ids belong to a different payment; nothing was recorded.', 409, conflicts)
+    if errors:
+        raise ApiError('Some payments are invalid; nothing was recorded.', 422, errors)
+
+    recorded_at = ledger.timestamp_now()
+    try:
+        new_ids = []
+        for row in rows:
+            cursor = db.execute('INSERT INTO payments (student_reg_number, amount_kobo, payment_date, term, '
+                                'academic_year, recorded_by, client_id) VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+            new_ids.append(cursor.lastrowid)
+        db.executemany('''
+            INSERT INTO payment_events (payment_id, student_reg_number, academic_year, term,
+                                        event_type, amount_kobo, recorded_by, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(payment_id, row[0], row[4], row[3], ledger.EVENT_CREATED, row[1], row[5], recorded_at)
+              for payment_id, row in zip(new_ids, rows)])
+        db.commit()
+        metrics.payments_recorded('api', len(rows), sum(row[1] for row in rows))
+    except sqlite3.IntegrityError as e:
+        db.rollback()
+        if not is_repeat(e):
+            raise ApiError(f'Database error: {e}', 500)
+        # Another upload with the same client_id committed first; going again dedupes against it.
+        if retrying:
+            raise ApiError('Payment is already being recorded; retry the upload.', 409)
+        return record_payments(items, retrying=True)
+    except sqlite3.Error as e:
+        db.rollback()
+        raise ApiError(f'Database error: {e}', 500)
+
+    ids, duplicates, inserted = [], [], iter(new_ids)
+    seen = {}
+    for index, item in enumerate(items):
+        client_id = item.get('client_id') or None
+        if client_id in existing:
+            ids.append(existing[client_id])
+            duplicates.append(index)
+        elif client_id in seen:
+            ids.append(seen[client_id])
+            duplicates.append(index)
+        else:
+            payment_id = next(inserted)
+            if client_id:
+                seen[client_id] = payment_id
+            ids.append(payment_id)
+    return ids, duplicates
+
+
+@api_bp.route('/payments/<int:payment_id>/reverse', methods=['POST'])
+@official_required
+def payment_reverse(payment_id):
+    """
+    Reverses a payment: {"version": n, "note": "..."}. version is the payment's version as
+    the client last read it; if the payment has changed since, nothing is recorded and the
+    answer is 409, so the client can reload and decide again.
+    """
+    return change_payment(payment_id, json_body(), ledger.reverse_payment)
+
+
+@api_bp.route('/payments/<int:payment_id>/correct', methods=['POST'])
+@official_required
+def payment_correct(payment_id):
+    """Sets a payment's amount: {"amount": "2500.00", "version": n, "note": "..."}; 409 as for reverse."""
+    data = json_body()
+    try:
+        amount_kobo = to_kobo(data.get('amount'))
+    except ArithmeticError:
+        amount_kobo = 0
+    if amount_kobo <= 0:
+        raise ApiError('amount must be positive; reverse the payment to cancel it.')
+    return change_payment(payment_id, data, ledger.correct_payment, amount_kobo)
+
+
+def change_payment(payment_id, data, change, *args):
+    version, note = data.get('version'), data.get('note')
+    if not isinstance(version, int) or isinstance(version, bool):
+        raise ApiError('version is required: send the version of the payment you read.')
+    if note is not None and not isinstance(note, str):
+        raise ApiError('note must be a string.')
+    db = get_db()
+    try:
+        change(db, payment_id, *args, session.get('username'), note, expected_version=version)
+        db.commit()
+    except ledger.UnknownPayment as e:
+        db.rollback()
+        raise ApiError(str(e), 404)
+    except ValueError as e:
+        # StaleUpdate, or a reversal of a payment that is already reversed.
+        db.rollback()
+        raise ApiError(str(e), 409)
+    except sqlite3.Error as e:
+        db.rollback()
+        raise ApiError(f'Database error: {e}', 500)
+    version, amount_kobo = ledger.payment_state(db, payment_id)
+    return json_response({'id': payment_id, 'version': version, 'amount': str(from_kobo(amount_kobo))})
+
+
+SYNC_TABLES = {
+    # table: (key column, columns sent to the tablet)
+    'students': ('reg_number', 'id, reg_number, name, class, term, academic_year'),
+    'payments': ('id', 'id, student_reg_number, amount_kobo, payment_date, term, academic_year, recorded_by, client_id'),
+    'payment_events': ('id', 'id, payment_id, student_reg_number, academic_year, term, event_type, amount_kobo, recorded_at'),
+}
+
+
+@api_bp.route('/sync')
+@official_required
+def sync():
+    """
+    Rows changed since the client's last sequence number: GET /api/v1/sync?since=<seq>.
+    The changelog keeps one entry per row, so the response size depends on what changed,
+    not on the size of the school. Deleted rows come back as tombstones (keys only).
+    Keep calling with since=next_since while more is true.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        raise ApiError('since must be a sequence number.')
+    limit = page_size()
+    db = get_db()
+    entries = db.execute('SELECT seq, table_name, row_key, op FROM changelog WHERE seq > ? ORDER BY seq LIMIT ?',
+                         (since, limit + 1)).fetchall()
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    changed = {table: [] for table in SYNC_TABLES}
+    deleted = {table: [] for table in SYNC_TABLES}
+    for entry in entries:
+        (deleted if entry['op'] == 'delete' else changed)[entry['table_name']].append(entry['row_key'])
+
+    rows = {}
+    for table, keys in changed.items():
+        key_column, columns = SYNC_TABLES[table]
+        rows[table] = []
+        for chunk in chunks(keys):
+            rows[table].extend(dict(row) for row in db.execute(
+                f"SELECT {columns} FROM {table} WHERE {key_column} IN ({','.join('?' * len(chunk))})", chunk))
+
+    return json_response({
+        'changes': rows,
+        'deleted': {table: keys for table, keys in deleted.items() if keys},
+        'next_since': entries[-1]['seq'] if entries else since,
+        'more': more,
+    })
+
+
+@api_bp.route('/sync', methods=['POST'])
+@official_required
+def sync_upload():
+    """Uploads payments recorded offline: {"payments": [... each with a client_id, a UUID made on the device ...]}."""
+    items = payment_items(json_body())
+    if any(not item.get('client_id') for item in items):
+        raise ApiError('Every offline payment needs a client_id.')
+    ids, duplicates = record_payments(items)
+    return json_response({'ids': ids, 'duplicates': duplicates})
@@ -0,0 +1,167 @@
+# app/compression.py
+# Response compression and static asset caching.
+#
+# - Text responses (HTML, JSON, CSS, JS, SVG) over COMPRESS_MIN_SIZE bytes are compressed
+#   with Brotli when the optional `brotli` package is installed and the client accepts it,
+#   otherwise gzip (or deflate).
+# - Static files can be precompressed once with `flask compress-static`; the .br/.gz
+#   variants are then served as-is instead of compressing on every request.
+# - url_for('static', ...) adds ?v=<content hash>. Requests carrying the current hash are
+#   served with a one-year immutable Cache-Control, so browsers stop revalidating them.
+import gzip
+import hashlib
+import mimetypes
+import os
+import zlib
+
+import click
+from flask import abort, current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is used when Brotli isn't installed
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+STATIC_REVALIDATE_MAX_AGE = 300
+
+
+def _compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def _choose_encoding(available):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip', 'deflate'):
+        if encoding in available and accepted[encoding]:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level)
+    return zlib.compress(data, level)
+
+
+def _available_encodings():
+    return ('br', 'gzip', 'deflate') if brotli else ('gzip', 'deflate')
+
+
+def compress_response(response):
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or not _compressible(response.mimetype)):
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    encoding = _choose_encoding(_available_encodings())
+    if encoding is None:
+        return response
+    response.set_data(compress(data, encoding, current_app.config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = encoding
+    if response.get_etag()[0]:
+        # The compressed body is a different representation of the same resource.
+        response.set_etag(f'{response.get_etag()[0]}-{encoding}', weak=True)
+    return response
+
+
+_hash_cache = {}
+
+
+def static_file(static_folder, filename):
+    """Path of a regular file inside static_folder, or None (also for '..' and absolute names)."""
+    path = safe_join(static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+def static_hash(static_folder, filename):
+    """First 12 hex digits of the file's SHA-256, cached per (path, mtime, size)."""
+    path = static_file(static_folder, filename)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _hash_cache.get(key)
+    metrics.cache_lookup('static_hash', digest is not None)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        _hash_cache[key] = digest
+    return digest
+
+
+def init_app(app):
+    app.after_request(compress_response)
+
+    @app.url_defaults
+    def add_static_hash(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            digest = static_hash(app.static_folder, values['filename'])
+            if digest:
+                values['v'] = digest
+
+    def static(filename):
+        # Resolved before anything touches the disk, so '../' can't reach outside the folder.
+        path = static_file(app.static_folder, filename)
+        if path is None:
+            abort(404)
+        versioned = bool(request.args.get('v')) and request.args['v'] == static_hash(app.static_folder, filename)
+        max_age = STATIC_IMMUTABLE_MAX_AGE if versioned else STATIC_REVALIDATE_MAX_AGE
+        # Serve a precompressed variant when one exists and the client accepts it.
+        variants = [e for e, suffix in (('br', '.br'), ('gzip', '.gz')) if os.path.isfile(path + suffix)]
+        encoding = _choose_encoding(variants) if variants else None
+        if encoding:
+            suffix = '.br' if encoding == 'br' else '.gz'
+            response = send_from_directory(app.static_folder, filename + suffix, max_age=max_age,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = send_from_directory(app.static_folder, filename, max_age=max_age)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        if versioned:
+            response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+
+    @app.cli.command('compress-static')
+    def compress_static_command():
+        """Write .gz (and .br, with Brotli installed) next to every compressible static file."""
+        written = precompress_static(app.static_folder)
+        click.echo(f'Wrote {written} precompressed files.')
+
+
+def precompress_static(static_folder):
+    """Compresses at the highest levels, since this runs once per deploy rather than per request."""
+    written = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if name.endswith(('.gz', '.br')) or not _compressible(mimetypes.guess_type(name)[0]):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for encoding, suffix in (('gzip', '.gz'), ('br', '.br')):
+                if encoding == 'br' and brotli is None:
+                    continue
+                compressed = compress(data, encoding, 9 if encoding == 'gzip' else 11)
+                # Only keep a variant that is actually smaller.
+                if len(compressed) < len(data):
+                    with open(path + suffix, 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+    return written
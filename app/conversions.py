@@ -0,0 +1,70 @@
+# app/conversions.py
+# Money and date conversions shared by the app package and app.py, so both store and show
+# amounts and read the old free-text date columns the same way.
+import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Money is stored as integer kobo so that sums and comparisons are exact.
+KOBO_PER_NAIRA = 100
+
+# Date formats seen in the old free-text date columns, tried in order.
+LEGACY_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%m/%d/%Y', '%d %B %Y', '%d %b %Y')
+
+
+def to_kobo(value):
+    """
+    Converts a naira amount (str, int, float or Decimal) to integer kobo. Anything that isn't
+    a finite number, including 'nan' and 'inf', raises decimal.InvalidOperation (an
+    ArithmeticError).
+    """
+    naira = Decimal(str(value))
+    if not naira.is_finite():
+        raise InvalidOperation(f'Not a finite amount: {value!r}')
+    naira = naira.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return int(naira * KOBO_PER_NAIRA)
+
+
+def from_kobo(kobo):
+    return (Decimal(kobo or 0) / KOBO_PER_NAIRA).quantize(Decimal('0.01'))
+
+
+def format_currency(value):
+    """
+    Jinja filter: 12345.5 -> '12,345.50'. Dispatches on the exact type so the common cases
+    (float from SQL, int kobo-free amounts, Decimal from from_kobo) skip the float()
+    round-trip; anything else falls back to the old conversion.
+    """
+    kind = type(value)
+    if kind is float or kind is Decimal:
+        return format(value, ',.2f')
+    if kind is int:
+        return f'{value:,}.00'
+    try:
+        return format(float(value), ',.2f')
+    except (ValueError, TypeError):
+        return value
+
+
+def parse_date(value):
+    """Parses a date from a form field or a legacy text column. Returns None if blank or unparseable."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if value is None or isinstance(value, datetime.date):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    # ISO timestamps ('2025-10-01 08:30:00', '2025-10-01T08:30') keep only the date.
+    value = value.split('T')[0].split(' ')[0] if value[:4].isdigit() else value
+    for fmt in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_date(value):
+    """Returns an ISO 'YYYY-MM-DD' string for a date value, or None if it is blank or can't be parsed."""
+    parsed = parse_date(value)
+    return parsed.isoformat() if parsed else None
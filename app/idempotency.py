@@ -0,0 +1,79 @@
+# app/idempotency.py
+# Duplicate-submit protection for payments. Every payment form carries a one-time key
+# (and API uploads a client_id); the key is stored with the payment under a unique index,
+# so a double-click, browser retry or re-upload can only ever post once. For the forms,
+# RecentKeys sits in front of that index and answers repeats of a recent submission
+# without a query; API uploads read the stored payment, to check it is the same one.
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from . import metrics
+
+# The unique index behind idempotency keys; see is_repeat().
+KEY_INDEX_COLUMN = 'payments.client_id'
+
+
+def new_key():
+    return secrets.token_urlsafe(16)
+
+
+class RecentKeys:
+    """
+    Thread-safe map of recently used idempotency keys to the payment they recorded,
+    bounded in size and age. Only a shortcut: the unique index is what guarantees a key
+    posts once, including across worker processes. Hits and misses are counted in
+    /metrics under `name`.
+    """
+    def __init__(self, ttl_seconds=600, max_entries=10_000, name='recent_payments'):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+        metrics.cache_lookup(self.name, entry is not None)
+        return entry[0] if entry is not None else None
+
+    def add(self, key, payment_id):
+        with self._lock:
+            self._entries[key] = (payment_id, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def init_app(app):
+    # One per app, shared by the payment form and the API.
+    app.extensions['recent_payments'] = RecentKeys()
+
+
+def _cache_key(key):
+    # Apps in one process can point at different databases; a key only counts in its own.
+    return current_app.config['DATABASE'], key
+
+
+def recorded_payment(key):
+    """Id of the payment recently recorded with this key, if this process remembers it."""
+    return current_app.extensions['recent_payments'].get(_cache_key(key))
+
+
+def remember_payment(key, payment_id):
+    current_app.extensions['recent_payments'].add(_cache_key(key), payment_id)
+
+
+def is_repeat(error):
+    """
+    Whether an IntegrityError is the idempotency-key index rejecting a repeat, rather
+    than some other constraint that should be reported as it is.
+    """
+    return str(error) == f'UNIQUE constraint failed: {KEY_INDEX_COLUMN}'
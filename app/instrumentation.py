@@ -0,0 +1,82 @@
+# app/instrumentation.py
+# In-process timing registry. Template renders are timed through Flask's template signals;
+# anything else can call record() with its own name. Totals are per worker process.
+import threading
+import time
+
+from flask import before_render_template, template_rendered
+
+# Upper bounds (seconds) of the latency buckets kept for every timer.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_lock = threading.Lock()
+_timers = {}
+_local = threading.local()
+
+
+class Timer:
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+
+def record(name, seconds):
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            timer = _timers[name] = Timer()
+        timer.observe(seconds)
+
+
+def timings(prefix=''):
+    """{name: {'count', 'total', 'mean', 'max', 'buckets'}} for timers starting with prefix."""
+    with _lock:
+        return {
+            name: {
+                'count': t.count,
+                'total': t.total,
+                'mean': t.total / t.count if t.count else 0.0,
+                'max': t.max,
+                'buckets': dict(zip([*map(str, BUCKETS), '+Inf'], t.buckets)),
+            }
+            for name, t in _timers.items() if name.startswith(prefix)
+        }
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+
+
+def _render_started(app, template, context, **extra):
+    stack = getattr(_local, 'renders', None)
+    if stack is None:
+        stack = _local.renders = []
+    stack.append(time.perf_counter())
+
+
+def _render_finished(app, template, context, **extra):
+    stack = getattr(_local, 'renders', None)
+    if stack:
+        record(f'template:{template.name}', time.perf_counter() - stack.pop())
+
+
+def init_app(app):
+    """Times every template render of this app (nested includes/extends count once)."""
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
@@ -0,0 +1,210 @@
+# app/ledger.py
+# Append-only payment event log. Rows in payment_events are never updated or deleted:
+# a payment is 'created' once and can later be 'reversed' or 'corrected', each event
+# carrying the signed change in kobo. Balances are the sum of those changes.
+#
+# Balances for every (student, academic year, term) are periodically compacted into a
+# binary snapshot, so the balance at a past moment is the nearest earlier snapshot plus
+# the events it doesn't cover, instead of a replay of the whole history. A snapshot
+# records the highest event id it saw, so an event stamped before the snapshot but
+# committed after it is still replayed.
+import datetime
+import struct
+import sys
+import zlib
+from array import array
+
+EVENT_CREATED = 'created'
+EVENT_REVERSED = 'reversed'
+EVENT_CORRECTED = 'corrected'
+
+SNAPSHOT_FORMAT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct('<BII')  # format version, entry count, key blob length
+# Snapshots taken without an explicit as_of stop this far behind the clock, well past the
+# length of any payment transaction.
+SNAPSHOT_LAG = datetime.timedelta(minutes=5)
+
+
+def timestamp_now():
+    return datetime.datetime.now().isoformat(sep=' ', timespec='microseconds')
+
+
+def _timestamp(at):
+    # A bare date means the end of that day.
+    if isinstance(at, datetime.datetime):
+        return at.isoformat(sep=' ', timespec='microseconds')
+    if isinstance(at, datetime.date):
+        return f'{at.isoformat()} 23:59:59.999999'
+    return at
+
+
+def encode_balances(balances):
+    """
+    Packs {(reg_number, academic_year, term): kobo} into a compact, zlib-compressed blob:
+    a header, the keys as one tab/newline separated UTF-8 blob, then the balances as int64s.
+    """
+    keys = sorted(balances)
+    key_blob = '\n'.join('\t'.join(part or '' for part in key) for key in keys).encode('utf-8')
+    amounts = array('q', (balances[key] for key in keys))
+    if sys.byteorder != 'little':
+        amounts.byteswap()
+    body = _SNAPSHOT_HEADER.pack(SNAPSHOT_FORMAT_VERSION, len(keys), len(key_blob)) + key_blob + amounts.tobytes()
+    return zlib.compress(body, 6)
+
+
+def decode_balances(blob):
+    body = zlib.decompress(blob)
+    version, count, key_length = _SNAPSHOT_HEADER.unpack_from(body)
+    if version != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f'Unsupported balance snapshot format {version}')
+    start = _SNAPSHOT_HEADER.size
+    key_blob = body[start:start + key_length].decode('utf-8')
+    keys = [tuple(line.split('\t')) for line in key_blob.split('\n')] if count else []
+    amounts = array('q')
+    amounts.frombytes(body[start + key_length:])
+    if sys.byteorder != 'little':
+        amounts.byteswap()
+    return dict(zip(keys, amounts))
+
+
+def record_event(db, payment_id, event_type, amount_kobo, recorded_by, note=None, recorded_at=None):
+    """Appends one event. The caller commits, so the event lands in the same transaction as the payment."""
+    payment = db.execute('SELECT student_reg_number, academic_year, term FROM payments WHERE id = ?',
+                         (payment_id,)).fetchone()
+    db.execute('''
+        INSERT INTO payment_events (payment_id, student_reg_number, academic_year, term,
+                                    event_type, amount_kobo, recorded_by, recorded_at, note)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (payment_id, payment[0], payment[1], payment[2], event_type, amount_kobo,
+          recorded_by, recorded_at or timestamp_now(), note))
+
+
+def payment_amount(db, payment_id):
+    """Current amount of a payment in kobo, after any reversal or corrections."""
+    return db.execute('SELECT COALESCE(SUM(amount_kobo), 0) FROM payment_events WHERE payment_id = ?',
+                      (payment_id,)).fetchone()[0]
+
+
+class StaleUpdate(ValueError):
+    """The payment was reversed or corrected by someone else after it was read."""
+
+
+class UnknownPayment(ValueError):
+    """There is no payment with that id."""
+
+
+def payment_state(db, payment_id):
+    """(version, current amount in kobo) of a payment, read together."""
+    row = db.execute('''
+        SELECT p.version, COALESCE((SELECT SUM(e.amount_kobo) FROM payment_events e WHERE e.payment_id = p.id), 0)
+        FROM payments p WHERE p.id = ?
+    ''', (payment_id,)).fetchone()
+    if row is None:
+        raise UnknownPayment(f'Payment {payment_id} does not exist.')
+    return row[0], row[1]
+
+
+def _claim(db, payment_id, version):
+    # Optimistic lock: only one writer can move the payment on from the version it read.
+    cursor = db.execute('UPDATE payments SET version = version + 1 WHERE id = ? AND version = ?',
+                        (payment_id, version))
+    if cursor.rowcount == 0:
+        raise StaleUpdate(f'Payment {payment_id} was changed by someone else; reload and try again.')
+
+
+def reverse_payment(db, payment_id, recorded_by, note=None, expected_version=None):
+    """
+    Reverses a payment. expected_version is the version the user was shown, if any;
+    StaleUpdate is raised when the payment has changed since (or changes concurrently).
+    """
+    version, current = payment_state(db, payment_id)
+    if expected_version is not None and expected_version != version:
+        raise StaleUpdate(f'Payment {payment_id} was changed by someone else; reload and try again.')
+    if current == 0:
+        raise ValueError(f'Payment {payment_id} is already reversed.')
+    _claim(db, payment_id, version)
+    record_event(db, payment_id, EVENT_REVERSED, -current, recorded_by, note)
+
+
+def correct_payment(db, payment_id, new_amount_kobo, recorded_by, note=None, expected_version=None):
+    """Sets a payment's amount; see reverse_payment for expected_version and StaleUpdate."""
+    version, current = payment_state(db, payment_id)
+    if expected_version is not None and expected_version != version:
+        raise StaleUpdate(f'Payment {payment_id} was changed by someone else; reload and try again.')
+    delta = new_amount_kobo - current
+    if delta:
+        _claim(db, payment_id, version)
+        record_event(db, payment_id, EVENT_CORRECTED, delta, recorded_by, note)
+
+
+def take_snapshot(db, as_of=None):
+    """
+    Compacts balances for events recorded up to as_of (default: SNAPSHOT_LAG ago) into
+    balance_snapshots, starting from the previous snapshot, together with the highest event
+    id included. Returns the number of balances stored.
+    """
+    as_of = _timestamp(as_of or datetime.datetime.now() - SNAPSHOT_LAG)
+    last_event_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM payment_events').fetchone()[0]
+    balances = balances_at(db, as_of, up_to_id=last_event_id)
+    db.execute('INSERT INTO balance_snapshots (as_of, last_event_id, entries, data) VALUES (?, ?, ?, ?)',
+               (as_of, last_event_id, len(balances), encode_balances(balances)))
+    db.commit()
+    return len(balances)
+
+
+def _nearest_snapshot(db, at):
+    return db.execute('SELECT as_of, last_event_id, data FROM balance_snapshots WHERE as_of <= ? '
+                      'ORDER BY as_of DESC LIMIT 1', (at,)).fetchone()
+
+
+def _not_in_snapshot(snapshot, at, up_to_id=None):
+    """
+    Subquery (and parameters) for the events recorded up to `at` that a snapshot doesn't
+    include. A snapshot covers the events recorded up to its as_of that were committed
+    (id <= last_event_id) when it was taken, so the rest is two disjoint index ranges:
+    events recorded after as_of, and events recorded before it but committed later.
+    """
+    limit, limit_params = (' AND id <= ?', (up_to_id,)) if up_to_id is not None else ('', ())
+    if snapshot is None:
+        return f'(SELECT * FROM payment_events WHERE recorded_at <= ?{limit})', (at, *limit_params)
+    as_of, last_event_id = snapshot[0], snapshot[1]
+    source = f'SELECT * FROM payment_events WHERE recorded_at > ? AND recorded_at <= ?{limit}'
+    params = (as_of, at, *limit_params)
+    # Snapshots taken before last_event_id was recorded only have the as_of boundary.
+    if last_event_id is not None:
+        source += f' UNION ALL SELECT * FROM payment_events WHERE id > ? AND recorded_at <= ?{limit}'
+        params += (last_event_id, as_of, *limit_params)
+    return f'({source})', params
+
+
+def balances_at(db, at, up_to_id=None):
+    """
+    All non-zero balances from events recorded up to `at` (and, with up_to_id, with an id no
+    higher than that), replayed from the nearest snapshot.
+    """
+    at = _timestamp(at)
+    snapshot = _nearest_snapshot(db, at)
+    balances = decode_balances(snapshot[2]) if snapshot else {}
+    events, params = _not_in_snapshot(snapshot, at, up_to_id)
+    rows = db.execute(f'''
+        SELECT student_reg_number, academic_year, term, SUM(amount_kobo)
+        FROM {events}
+        GROUP BY student_reg_number, academic_year, term
+    ''', params)
+    for reg_number, academic_year, term, delta in rows:
+        key = (reg_number, academic_year or '', term or '')
+        balances[key] = balances.get(key, 0) + delta
+    return {key: kobo for key, kobo in balances.items() if kobo}
+
+
+def balance_at(db, reg_number, academic_year, term, at):
+    """Amount paid by one student for a term, as it stood at `at`."""
+    at = _timestamp(at)
+    snapshot = _nearest_snapshot(db, at)
+    base = decode_balances(snapshot[2]).get((reg_number, academic_year or '', term or ''), 0) if snapshot else 0
+    events, params = _not_in_snapshot(snapshot, at)
+    delta = db.execute(f'''
+        SELECT COALESCE(SUM(amount_kobo), 0) FROM {events}
+        WHERE student_reg_number = ? AND academic_year = ? AND term = ?
+    ''', (*params, reg_number, academic_year, term)).fetchone()[0]
+    return base + delta
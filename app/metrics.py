@@ -0,0 +1,426 @@
+# app/metrics.py
+# Operational metrics in the Prometheus text format, plus /healthz and /readyz. Every
+# process writes its samples to its own memory-mapped file in METRICS_DIR (<pid>.db), so
+# an update is an in-place write of one float and nothing has to be flushed; /metrics,
+# answered by whichever worker gets the scrape, reads every file and adds them up.
+# Counters and histograms of workers that have exited keep counting towards the totals;
+# gauges only count for processes that are still running. A process that finds a file
+# under its own pid (left by an exited process the pid was recycled from) retires it
+# before starting a fresh one. Empty METRICS_DIR when the server starts (for gunicorn,
+# in its on_starting hook) to begin again from zero.
+#
+# /metrics answers only clients in METRICS_ALLOWED_IPS, or any client sending
+# "Authorization: Bearer <METRICS_TOKEN>" when a token is configured.
+import glob
+import hmac
+import ipaddress
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+
+from flask import abort, g, jsonify, request
+
+from .instrumentation import BUCKETS
+
+# name: (type, help). A histogram is written as <name>_bucket, <name>_sum and <name>_count.
+FAMILIES = {
+    'alfurqan_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status code.'),
+    'alfurqan_http_request_duration_seconds': ('histogram', 'Time taken to answer HTTP requests, by endpoint.'),
+    'alfurqan_db_queries_total': ('counter', 'Database statements executed, by statement type.'),
+    'alfurqan_db_query_seconds_total': ('counter', 'Time spent executing database statements, by statement type.'),
+    'alfurqan_db_connections_opened_total': ('counter', 'Database connections opened.'),
+    'alfurqan_db_connections_open': ('gauge', 'Database connections currently open.'),
+    'alfurqan_db_pool_checked_out': ('gauge', 'Pooled database connections currently in use.'),
+    'alfurqan_payments_recorded_total': ('counter', 'Payments recorded, by source.'),
+    'alfurqan_payments_recorded_kobo_total': ('counter', 'Amount of the payments recorded, in kobo, by source.'),
+    'alfurqan_cache_requests_total': ('counter', 'Cache lookups, by cache and result (hit or miss).'),
+    'alfurqan_cache_hit_ratio': ('gauge', 'Share of all cache lookups so far that were hits, by cache.'),
+}
+# Served outside login, tenant and schema checks.
+HEALTH_ENDPOINTS = ('healthz', 'readyz', 'metrics')
+STATEMENTS = ('select', 'insert', 'update', 'delete')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_HEADER = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 64 * 1024
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _padded(size):
+    return (size + 7) & ~7
+
+
+def _entries(data, used):
+    """(sample key, offset of its value) for the entries in a file's first `used` bytes."""
+    used = min(used, len(data))
+    offset = _HEADER.size
+    while offset + _LENGTH.size <= used:
+        length, = _LENGTH.unpack_from(data, offset)
+        position = offset + _padded(_LENGTH.size + length)
+        if position + _VALUE.size > used:
+            break
+        yield bytes(data[offset + _LENGTH.size:offset + _LENGTH.size + length]).decode(), position
+        offset = position + _VALUE.size
+
+
+class _SampleFile:
+    """
+    One process's samples: the number of bytes in use, then entries of (key length, key,
+    padding to 8 bytes, float64 value). Entries are only ever appended.
+    """
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _INITIAL_SIZE:
+            size = _INITIAL_SIZE
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        self._positions = dict(_entries(self._map, self._used))
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        value, = _VALUE.unpack_from(self._map, position)
+        _VALUE.pack_into(self._map, position, value + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        start = self._used
+        position = start + _padded(_LENGTH.size + len(encoded))
+        end = position + _VALUE.size
+        if end > len(self._map):
+            self._grow(end)
+        _LENGTH.pack_into(self._map, start, len(encoded))
+        self._map[start + _LENGTH.size:start + _LENGTH.size + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, position, 0.0)
+        # The header moves last, so a reader never sees a half-written entry.
+        _HEADER.pack_into(self._map, 0, end)
+        self._used = end
+        self._positions[key] = position
+        return position
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+
+_lock = threading.Lock()
+_directory = None
+_samples = None
+# Sample files this process has written, which it may reopen and keep adding to.
+_opened = set()
+
+
+def _forked():
+    # A forked worker must not write into its parent's file (the mapping is shared).
+    global _lock, _samples, _opened
+    _lock = threading.Lock()
+    _samples = None
+    _opened = set()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forked)
+
+
+def configure(directory):
+    """Sets the directory this process writes its samples to; None turns recording off."""
+    global _directory, _samples
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _lock:
+        if directory != _directory:
+            _directory, _samples = directory, None
+
+
+def _open_samples():
+    pid = os.getpid()
+    path = os.path.join(_directory, f'{pid}.db')
+    if path not in _opened and os.path.exists(path):
+        # Left by an exited process with the same pid: its counters still count (as a
+        # retired file, see collect), but its gauges must not become this process's.
+        os.replace(path, os.path.join(_directory, f'{pid}.{time.time_ns()}.db'))
+    _opened.add(path)
+    return _SampleFile(path)
+
+
+def _add(key, amount):
+    global _samples
+    if _directory is None:
+        return
+    with _lock:
+        if _samples is None:
+            _samples = _open_samples()
+        _samples.add(key, amount)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in labels.items()) + '}'
+
+
+def inc(name, amount=1, **labels):
+    """Adds to a counter, or to a gauge (a negative amount takes away)."""
+    _add(_key(name, labels), amount)
+
+
+def observe(name, seconds, **labels):
+    """Records one observation in a histogram with the instrumentation BUCKETS."""
+    for bound in BUCKETS:
+        if seconds <= bound:
+            le = str(bound)
+            break
+    else:
+        le = '+Inf'
+    _add(_key(f'{name}_bucket', {**labels, 'le': le}), 1)
+    _add(_key(f'{name}_sum', labels), seconds)
+    _add(_key(f'{name}_count', labels), 1)
+
+
+def cache_lookup(cache, hit):
+    inc('alfurqan_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def payments_recorded(source, count, kobo):
+    inc('alfurqan_payments_recorded_total', count, source=source)
+    inc('alfurqan_payments_recorded_kobo_total', kobo, source=source)
+
+
+def record_query(sql, seconds):
+    statement = sql.lstrip()[:6].lower()
+    if statement not in STATEMENTS:
+        statement = 'other'
+    inc('alfurqan_db_queries_total', statement=statement)
+    inc('alfurqan_db_query_seconds_total', seconds, statement=statement)
+
+
+class MeteredCursor(sqlite3.Cursor):
+    """sqlite3 cursor that counts and times its statements."""
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_query(sql_script, time.perf_counter() - started)
+
+
+class MeteredConnection(sqlite3.Connection):
+    """sqlite3 connection (use as connect(factory=...)) whose statements all go through MeteredCursor."""
+    def cursor(self, factory=MeteredCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _family(key):
+    name = key.partition('{')[0]
+    if name in FAMILIES:
+        return name
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and FAMILIES.get(name[:-len(suffix)], ('',))[0] == 'histogram':
+            return name[:-len(suffix)]
+    return None
+
+
+def collect(directory):
+    """
+    {sample key: value} added up over every process's file in directory. <pid>.db belongs
+    to a running process if that pid is alive; retired files (<pid>.<time>.db) never do.
+    """
+    totals = {}
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        name = os.path.basename(path)[:-3]
+        try:
+            live = name.isdigit() and _alive(int(name))
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        if len(data) < _HEADER.size:
+            continue
+        used, = _HEADER.unpack_from(data, 0)
+        for key, position in _entries(data, used):
+            family = _family(key)
+            if family is None or (not live and FAMILIES[family][0] == 'gauge'):
+                continue
+            totals[key] = totals.get(key, 0.0) + _VALUE.unpack_from(data, position)[0]
+    return totals
+
+
+def _format(value):
+    return str(int(value)) if value.is_integer() and abs(value) < 2 ** 53 else repr(value)
+
+
+def _hit_ratios(totals):
+    lookups = {}
+    for key, value in totals.items():
+        if key.startswith('alfurqan_cache_requests_total{'):
+            labels = dict(_LABEL.findall(key))
+            counts = lookups.setdefault(labels['cache'], [0.0, 0.0])
+            counts[labels['result'] == 'hit'] += value
+    return {_key('alfurqan_cache_hit_ratio', {'cache': cache}): hits / (hits + misses)
+            for cache, (misses, hits) in lookups.items() if hits + misses}
+
+
+def _histogram_lines(family, samples):
+    series = {}
+    for key, value in samples:
+        name, brace, labels = key.partition('{')
+        labels = labels[:-1] if brace else ''
+        suffix = name[len(family):]
+        if suffix == '_bucket':
+            # le is always the last label.
+            labels, _, le = labels.rpartition('le="')
+            labels = labels.rstrip(',')
+        entry = series.setdefault(labels, {'buckets': {}, '_sum': 0.0, '_count': 0.0})
+        if suffix == '_bucket':
+            entry['buckets'][le[:-1]] = value
+        else:
+            entry[suffix] = value
+    lines = []
+    for labels, entry in sorted(series.items()):
+        prefix = labels + ',' if labels else ''
+        cumulative = 0.0
+        for bound in BUCKETS:
+            cumulative += entry['buckets'].get(str(bound), 0.0)
+            lines.append(f'{family}_bucket{{{prefix}le="{bound}"}} {_format(cumulative)}')
+        lines.append(f'{family}_bucket{{{prefix}le="+Inf"}} {_format(entry["_count"])}')
+        braces = f'{{{labels}}}' if labels else ''
+        lines.append(f'{family}_sum{braces} {_format(entry["_sum"])}')
+        lines.append(f'{family}_count{braces} {_format(entry["_count"])}')
+    return lines
+
+
+def exposition(directory):
+    """Every family with samples, in the Prometheus text format."""
+    totals = collect(directory) if directory else {}
+    totals.update(_hit_ratios(totals))
+    samples = {}
+    for key, value in totals.items():
+        samples.setdefault(_family(key), []).append((key, value))
+    lines = []
+    for family, (kind, help_text) in FAMILIES.items():
+        if family not in samples:
+            continue
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        if kind == 'histogram':
+            lines.extend(_histogram_lines(family, samples[family]))
+        else:
+            lines.extend(f'{key} {_format(value)}' for key, value in sorted(samples[family]))
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _networks(addresses):
+    """METRICS_ALLOWED_IPS as networks: a comma-separated string or a list of addresses or CIDRs."""
+    if isinstance(addresses, str):
+        addresses = addresses.split(',')
+    return tuple(ipaddress.ip_network(address.strip(), strict=False) for address in addresses or () if address.strip())
+
+
+def _scrape_allowed(networks, token):
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode()):
+            return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def init_app(app, readiness):
+    """
+    Records every request's latency and status, and adds /healthz, /readyz and /metrics.
+    readiness() returns {check: (ok, detail)}; /readyz answers 503 unless every check is ok.
+    Samples go to app.config['METRICS_DIR'] (None turns metrics off). /metrics is limited
+    by METRICS_ALLOWED_IPS and METRICS_TOKEN.
+    """
+    configure(app.config['METRICS_DIR'])
+    allowed_networks = _networks(app.config.get('METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')))
+    token = app.config.get('METRICS_TOKEN')
+
+    @app.before_request
+    def start_request_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('_request_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'none'
+            observe('alfurqan_http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+            inc('alfurqan_http_requests_total', endpoint=endpoint, method=request.method,
+                status=response.status_code)
+        return response
+
+    def healthz():
+        """The process is up and answering requests."""
+        return jsonify(status='ok')
+
+    def readyz():
+        """The database is reachable and its schema is current."""
+        checks = readiness()
+        ready = all(ok for ok, _ in checks.values())
+        return jsonify(status='ready' if ready else 'unavailable',
+                       checks={name: detail for name, (_, detail) in checks.items()}), 200 if ready else 503
+
+    def metrics():
+        # Payment counts and totals are business data: not for whoever can reach the server.
+        if not _scrape_allowed(allowed_networks, token):
+            abort(403)
+        response = app.response_class(exposition(app.config['METRICS_DIR']), content_type=CONTENT_TYPE)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    for endpoint, view in zip(HEALTH_ENDPOINTS, (healthz, readyz, metrics)):
+        app.add_url_rule(f'/{endpoint}', endpoint, view)
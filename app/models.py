@@ -1,11 +1,122 @@
 # app/models.py
+import logging
+
 from . import get_db, bcrypt
+from .conversions import normalize_date, to_kobo
 
-def init_db():
-    db = get_db()
+log = logging.getLogger(__name__)
+
+def _columns(cursor, table):
+    return {row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()}
+
+# Original text of legacy values a migration couldn't convert, for someone to fix by hand.
+LEGACY_VALUES_TABLE = '''
+CREATE TABLE IF NOT EXISTS legacy_values (
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    column_name TEXT NOT NULL,
+    raw_value TEXT NOT NULL,
+    PRIMARY KEY (table_name, row_id, column_name)
+)
+'''
+
+def migrate_money_and_dates(db):
+    """
+    Moves REAL money columns to integer kobo and rewrites free-text dates as ISO dates.
+    Runs in a single transaction and does nothing once the columns are converted.
+    """
     cursor = db.cursor()
+    for table, old_column in (('payments', 'amount_paid'), ('fees', 'amount')):
+        columns = _columns(cursor, table)
+        if old_column not in columns:
+            continue
+        if 'amount_kobo' not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN amount_kobo INTEGER NOT NULL DEFAULT 0')
+        rows = cursor.execute(f'SELECT id, {old_column} FROM {table}').fetchall()
+        cursor.executemany(f'UPDATE {table} SET amount_kobo = ? WHERE id = ?',
+                           [(to_kobo(repr(float(row[1] or 0))), row[0]) for row in rows])
+        cursor.execute(f'ALTER TABLE {table} DROP COLUMN {old_column}')
 
-    # Create tables if they don't exist
+    # Dates that can't be read are cleared, but their original text is kept in legacy_values.
+    cursor.execute(LEGACY_VALUES_TABLE)
+    for table, column in (('payments', 'payment_date'), ('fees', 'due_date')):
+        rows = cursor.execute(f'SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL').fetchall()
+        updates, unreadable = [], []
+        for row_id, value in rows:
+            iso = normalize_date(value)
+            if iso != value:
+                updates.append((iso, row_id))
+            if iso is None and str(value).strip():
+                unreadable.append((table, row_id, column, str(value)))
+        cursor.executemany('INSERT OR REPLACE INTO legacy_values (table_name, row_id, column_name, raw_value) '
+                           'VALUES (?, ?, ?, ?)', unreadable)
+        cursor.executemany(f'UPDATE {table} SET {column} = ? WHERE id = ?', updates)
+        if unreadable:
+            log.warning('%d %s.%s values could not be read as dates; their text is kept in legacy_values.',
+                        len(unreadable), table, column)
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_payments_payment_date ON payments (payment_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_payments_student ON payments (student_reg_number, academic_year, term)')
+    db.commit()
+
+# Triggers that give every write to a synced table a new sequence number in changelog.
+# INSERT OR REPLACE on the (table_name, row_key) unique index keeps only a row's latest
+# change, and AUTOINCREMENT guarantees sequence numbers are never reused.
+CHANGELOG_TRIGGERS = '''
+CREATE TRIGGER IF NOT EXISTS changelog_students_insert AFTER INSERT ON students BEGIN
+    INSERT OR REPLACE INTO changelog (table_name, row_key, op) VALUES ('students', NEW.reg_number, 'upsert');
+END;
+CREATE TRIGGER IF NOT EXISTS changelog_students_update AFTER UPDATE ON students BEGIN
+    INSERT OR REPLACE INTO changelog (table_name, row_key, op)
+        SELECT 'students', OLD.reg_number, 'delete' WHERE OLD.reg_number <> NEW.reg_number;
+    INSERT OR REPLACE INTO changelog (table_name, row_key, op) VALUES ('students', NEW.reg_number, 'upsert');
+END;
+CREATE TRIGGER IF NOT EXISTS changelog_students_delete AFTER DELETE ON students BEGIN
+    INSERT OR REPLACE INTO changelog (table_name, row_key, op) VALUES ('students', OLD.reg_number, 'delete');
+END;
+CREATE TRIGGER IF NOT EXISTS changelog_payments_insert AFTER INSERT ON payments BEGIN
+    INSERT OR REPLACE INTO changelog (table_name, row_key, op) VALUES ('payments', NEW.id, 'upsert');
+END;
+CREATE TRIGGER IF NOT EXISTS changelog_payments_update AFTER UPDATE ON payments BEGIN
+    INSERT OR REPLACE INTO changelog (table_name, row_key, op) VALUES ('payments', NEW.id, 'upsert');
+END;
+CREATE TRIGGER IF NOT EXISTS changelog_payments_delete AFTER DELETE ON payments BEGIN
+    INSERT OR REPLACE INTO changelog (table_name, row_key, op) VALUES ('payments', OLD.id, 'delete');
+END;
+CREATE TRIGGER IF NOT EXISTS changelog_payment_events_insert AFTER INSERT ON payment_events BEGIN
+    INSERT OR REPLACE INTO changelog (table_name, row_key, op) VALUES ('payment_events', NEW.id, 'upsert');
+END;
+'''
+
+def init_changelog(db):
+    """Creates the changelog used by /api/v1/sync and seeds it with every existing row."""
+    cursor = db.cursor()
+    if 'client_id' not in _columns(cursor, 'payments'):
+        cursor.execute('ALTER TABLE payments ADD COLUMN client_id TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_payments_client_id ON payments (client_id) '
+                   'WHERE client_id IS NOT NULL')
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='changelog';")
+    if not cursor.fetchone():
+        cursor.execute('''
+            CREATE TABLE changelog (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_key TEXT NOT NULL,
+                op TEXT NOT NULL CHECK(op IN ('upsert', 'delete'))
+            );
+        ''')
+        cursor.execute('CREATE UNIQUE INDEX ux_changelog_row ON changelog (table_name, row_key)')
+        cursor.execute("INSERT INTO changelog (table_name, row_key, op) SELECT 'students', reg_number, 'upsert' FROM students")
+        cursor.execute("INSERT INTO changelog (table_name, row_key, op) SELECT 'payments', id, 'upsert' FROM payments")
+        cursor.execute("INSERT INTO changelog (table_name, row_key, op) SELECT 'payment_events', id, 'upsert' FROM payment_events")
+    cursor.executescript(CHANGELOG_TRIGGERS)
+    db.commit()
+
+# Schema changes, applied in order by migrate(). Each step is safe to re-run, so databases
+# created before versioning (user_version 0) are brought up to date by running them all.
+def _create_base_tables(db):
+    cursor = db.cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';")
     if not cursor.fetchone():
         cursor.execute('''
@@ -16,18 +127,7 @@ def init_db():
                 role TEXT NOT NULL
             );
         ''')
-        # Insert a default admin user
-        hashed_admin_password = bcrypt.generate_password_hash("admin").decode('utf-8')
-        cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
-                       ('admin', hashed_admin_password, 'admin'))
-        
-        # Insert a default official user
-        hashed_official_password = bcrypt.generate_password_hash("official").decode('utf-8')
-        cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
-                       ('official', hashed_official_password, 'official'))
-                       
         db.commit()
-        print("Default 'admin' and 'official' users created.")
 
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='students';")
     if not cursor.fetchone():
@@ -49,8 +149,8 @@ def init_db():
             CREATE TABLE fees (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 student_id INTEGER,
-                amount REAL,
-                due_date TEXT,
+                amount_kobo INTEGER NOT NULL DEFAULT 0,
+                due_date DATE,
                 FOREIGN KEY (student_id) REFERENCES students (id)
             );
         ''')
@@ -62,8 +162,8 @@ def init_db():
             CREATE TABLE payments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 student_reg_number TEXT,
-                payment_date TEXT,
-                amount_paid REAL,
+                payment_date DATE,
+                amount_kobo INTEGER NOT NULL DEFAULT 0,
                 term TEXT,
                 academic_year TEXT,
                 recorded_by TEXT,
@@ -72,4 +172,103 @@ def init_db():
         ''')
         db.commit()
 
-    print("Database initialized successfully!")
\ No newline at end of file
+def _create_event_log(db):
+    cursor = db.cursor()
+    # Append-only payment history and compacted balance snapshots (see ledger.py).
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='payment_events';")
+    if not cursor.fetchone():
+        cursor.execute('''
+            CREATE TABLE payment_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payment_id INTEGER NOT NULL,
+                student_reg_number TEXT NOT NULL,
+                academic_year TEXT,
+                term TEXT,
+                event_type TEXT NOT NULL CHECK(event_type IN ('created', 'reversed', 'corrected')),
+                amount_kobo INTEGER NOT NULL,
+                recorded_by TEXT,
+                recorded_at TIMESTAMP NOT NULL,
+                note TEXT,
+                FOREIGN KEY (payment_id) REFERENCES payments (id)
+            );
+        ''')
+        cursor.execute('CREATE INDEX ix_payment_events_recorded_at ON payment_events (recorded_at)')
+        cursor.execute('CREATE INDEX ix_payment_events_student ON payment_events (student_reg_number, academic_year, term)')
+        cursor.execute('CREATE INDEX ix_payment_events_payment ON payment_events (payment_id)')
+        # Payments recorded before the log existed become 'created' events.
+        cursor.execute('''
+            INSERT INTO payment_events (payment_id, student_reg_number, academic_year, term,
+                                        event_type, amount_kobo, recorded_by, recorded_at)
+            SELECT id, student_reg_number, academic_year, term, 'created', amount_kobo, recorded_by,
+                   COALESCE(payment_date, '0001-01-01') || ' 00:00:00.000000'
+            FROM payments
+        ''')
+        cursor.execute('''
+            CREATE TABLE balance_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                as_of TIMESTAMP NOT NULL UNIQUE,
+                last_event_id INTEGER,
+                entries INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+        ''')
+        db.commit()
+
+def _add_payment_version(db):
+    cursor = db.cursor()
+    # Bumped by every reversal or correction, so two concurrent edits can't both apply (see ledger.py).
+    if 'version' not in _columns(cursor, 'payments'):
+        cursor.execute('ALTER TABLE payments ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+        db.commit()
+
+def _add_snapshot_event_id(db):
+    cursor = db.cursor()
+    # Highest payment_events id a snapshot includes (see ledger.take_snapshot); NULL for older ones.
+    if 'last_event_id' not in _columns(cursor, 'balance_snapshots'):
+        cursor.execute('ALTER TABLE balance_snapshots ADD COLUMN last_event_id INTEGER')
+        db.commit()
+
+# The event-log backfill reads amount_kobo and ISO payment dates, so legacy money and date
+# columns are converted first.
+MIGRATIONS = (
+    (1, _create_base_tables),
+    (2, migrate_money_and_dates),
+    (3, _create_event_log),
+    (4, init_changelog),
+    (5, _add_payment_version),
+    (6, _add_snapshot_event_id),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(db):
+    """Version stored in the database file (PRAGMA user_version): one cheap query, no table scans."""
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(db):
+    """Applies the migrations newer than the stored version, recording each one as it completes."""
+    applied = []
+    for version, step in MIGRATIONS:
+        if version > schema_version(db):
+            step(db)
+            db.execute(f'PRAGMA user_version = {version}')
+            db.commit()
+            applied.append(version)
+    return applied
+
+def seed_default_users(db):
+    """Creates the default 'admin' and 'official' users in an empty users table."""
+    if db.execute('SELECT 1 FROM users LIMIT 1').fetchone():
+        return False
+    for username in ('admin', 'official'):
+        db.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
+                   (username, bcrypt.generate_password_hash(username).decode('utf-8'), username))
+    db.commit()
+    print("Default 'admin' and 'official' users created.")
+    return True
+
+def init_db():
+    """Migrates the database to SCHEMA_VERSION and creates the default users if there are none."""
+    db = get_db()
+    migrate(db)
+    seed_default_users(db)
+    print("Database initialized successfully!")
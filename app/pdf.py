@@ -0,0 +1,65 @@
+# app/pdf.py
+# A small pure-Python PDF writer for receipts and statements: text only, in the built-in
+# Helvetica fonts, paginated on A4. No third-party packages, so it runs anywhere the app does
+# (including the desktop build) and is cheap to start in worker processes.
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 50
+
+
+def _escape(text):
+    # The standard fonts use WinAnsi (close to Latin-1); anything else becomes '?'.
+    text = text.replace('₦', 'NGN ')
+    text = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('latin-1', errors='replace')
+
+
+def render_pdf(lines, title=''):
+    """
+    Renders lines of text into PDF bytes. Each line is a string or a tuple of
+    (text, font_size, bold) or (text, font_size, bold, x_offset) for simple columns.
+    """
+    pages, current, y = [], [], PAGE_HEIGHT - MARGIN
+    for line in lines:
+        if isinstance(line, str):
+            line = (line, 10, False)
+        text, size, bold = line[:3]
+        x = MARGIN + (line[3] if len(line) > 3 else 0)
+        # Lines that share a y position (columns) are marked by a leading offset; only the
+        # first column of a row advances the cursor.
+        if len(line) <= 3 or line[3] == 0:
+            y -= size * 1.5
+            if y < MARGIN:
+                pages.append(current)
+                current, y = [], PAGE_HEIGHT - MARGIN - size * 1.5
+        font = b'/F2' if bold else b'/F1'
+        current.append(b'BT %s %d Tf %.1f %.1f Td (%s) Tj ET' % (font, size, x, y, _escape(str(text))))
+    pages.append(current)
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # page tree, filled in once the page object numbers are known
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        b'<< /Title (%s) /Producer (Alfurqan Academy) >>' % _escape(title),
+    ]
+    page_refs = []
+    for content in pages:
+        stream = b'\n'.join(content)
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                       b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>'
+                       % (PAGE_WIDTH, PAGE_HEIGHT, len(objects)))
+        page_refs.append(b'%d 0 R' % len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(page_refs), len(page_refs))
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
@@ -1,7 +1,10 @@
 import sqlite3
 import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, g
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, g, jsonify
 from . import get_db, bcrypt
+from .conversions import to_kobo, from_kobo, normalize_date
+from . import ledger, instrumentation, metrics
+from .idempotency import new_key, recorded_payment, remember_payment, is_repeat
 
 # Create a Blueprint for the main routes.
 main_bp = Blueprint('main', __name__)
@@ -92,18 +95,17 @@ def dashboard():
     total_students_result = cursor.execute('SELECT COUNT(*) FROM students').fetchone()
     total_students = total_students_result[0] if total_students_result else 0
 
-    # Expected Revenue
-    total_expected_revenue_result = cursor.execute('SELECT SUM(amount) FROM fees').fetchone()
-    total_expected_revenue = total_expected_revenue_result[0] if total_expected_revenue_result[0] is not None else 0
-    
-    # Received Revenue
-    total_received_revenue_result = cursor.execute('SELECT SUM(amount_paid) FROM payments').fetchone()
-    total_received_revenue = total_received_revenue_result[0] if total_received_revenue_result[0] is not None else 0
+    # Expected Revenue (amounts are summed as integer kobo, then converted once)
+    total_expected_revenue = from_kobo(cursor.execute('SELECT COALESCE(SUM(amount_kobo), 0) FROM fees').fetchone()[0])
+
+    # Received Revenue, net of reversals and corrections
+    total_received_revenue = from_kobo(cursor.execute('SELECT COALESCE(SUM(amount_kobo), 0) FROM payment_events').fetchone()[0])
 
     # Outstanding Revenue
     total_outstanding_revenue = total_expected_revenue - total_received_revenue
 
-    # Fetch financial data per student to determine paid/partially paid/defaulters
+    # Fetch financial data per student to determine paid/partially paid/defaulters.
+    # Fees and payments are aggregated separately so one doesn't multiply the other's rows.
     student_financials = cursor.execute('''
         SELECT
             s.reg_number,
@@ -111,12 +113,13 @@ def dashboard():
             s.class,
             s.term,
             s.academic_year,
-            SUM(CASE WHEN f.id IS NOT NULL THEN f.amount ELSE 0 END) as total_fees,
-            COALESCE(SUM(p.amount_paid), 0) as total_paid
+            COALESCE(f.total_kobo, 0) as total_fees,
+            COALESCE(p.total_kobo, 0) as total_paid
         FROM students s
-        LEFT JOIN fees f ON s.id = f.student_id
-        LEFT JOIN payments p ON s.reg_number = p.student_reg_number
-        GROUP BY s.reg_number
+        LEFT JOIN (SELECT student_id, SUM(amount_kobo) AS total_kobo FROM fees GROUP BY student_id) f
+            ON s.id = f.student_id
+        LEFT JOIN (SELECT student_reg_number, SUM(amount_kobo) AS total_kobo FROM payment_events GROUP BY student_reg_number) p
+            ON s.reg_number = p.student_reg_number
     ''').fetchall()
 
     paid_students_count = 0
@@ -139,7 +142,7 @@ def dashboard():
                     'class': student['class'],
                     'term': student['term'],
                     'academic_year': student['academic_year'],
-                    'outstanding_amount': outstanding_amount
+                    'outstanding_amount': from_kobo(outstanding_amount)
                 })
             else:
                 partially_paid_count += 1
@@ -149,12 +152,12 @@ def dashboard():
                     'class': student['class'],
                     'term': student['term'],
                     'academic_year': student['academic_year'],
-                    'outstanding_amount': outstanding_amount
+                    'outstanding_amount': from_kobo(outstanding_amount)
                 })
 
     # --- Fetching Recent Payments Data ---
     recent_payments = cursor.execute('''
-        SELECT p.payment_date, p.term, p.academic_year, p.amount_paid, p.recorded_by, s.name
+        SELECT p.payment_date, p.term, p.academic_year, p.amount_kobo / 100.0 AS amount_paid, p.recorded_by, s.name
         FROM payments p
         JOIN students s ON p.student_reg_number = s.reg_number
         ORDER BY p.payment_date DESC
@@ -232,32 +235,63 @@ def record_payment():
     if request.method == 'POST':
         student_reg_number = request.form['student_reg_number']
         amount_paid = request.form['amount_paid']
-        payment_date = request.form['payment_date']
+        payment_date = normalize_date(request.form['payment_date'])
         term = request.form['term']
         academic_year = request.form['academic_year']
         recorded_by = session.get('username')
+        # Forms rendered before idempotency keys existed post without one.
+        idempotency_key = request.form.get('idempotency_key') or None
 
         db = get_db()
         cursor = db.cursor()
-        
+
+        if idempotency_key:
+            existing = recorded_payment(idempotency_key) or cursor.execute(
+                'SELECT id FROM payments WHERE client_id = ?', (idempotency_key,)).fetchone()
+            if existing:
+                flash('This payment was already recorded.', 'info')
+                return redirect(url_for('main.record_payment'))
+
         # Check if the student exists
         student = cursor.execute('SELECT id FROM students WHERE reg_number = ?', (student_reg_number,)).fetchone()
         if not student:
             flash(f"Student with registration number '{student_reg_number}' not found.", 'danger')
             return redirect(url_for('main.record_payment'))
 
+        try:
+            amount_kobo = to_kobo(amount_paid)
+        except ArithmeticError:
+            flash('Invalid amount. Please enter a valid number.', 'danger')
+            return redirect(url_for('main.record_payment'))
+        if amount_kobo <= 0 or payment_date is None:
+            flash('Payment amount must be positive and the payment date valid.', 'danger')
+            return redirect(url_for('main.record_payment'))
+
         try:
             cursor.execute('''
-                INSERT INTO payments (student_reg_number, amount_paid, payment_date, term, academic_year, recorded_by)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (student_reg_number, amount_paid, payment_date, term, academic_year, recorded_by))
+                INSERT INTO payments (student_reg_number, amount_kobo, payment_date, term, academic_year, recorded_by, client_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (student_reg_number, amount_kobo, payment_date, term, academic_year, recorded_by, idempotency_key))
+            payment_id = cursor.lastrowid
+            ledger.record_event(db, payment_id, ledger.EVENT_CREATED, amount_kobo, recorded_by)
             db.commit()
+            metrics.payments_recorded('form', 1, amount_kobo)
+            if idempotency_key:
+                remember_payment(idempotency_key, payment_id)
             flash(f"Payment of ₦{amount_paid} recorded for student '{student_reg_number}' successfully!", 'success')
             return redirect(url_for('main.record_payment'))
+        except sqlite3.IntegrityError as e:
+            db.rollback()
+            if is_repeat(e):
+                # A concurrent submit with the same key committed first.
+                flash('This payment was already recorded.', 'info')
+                return redirect(url_for('main.record_payment'))
+            flash(f"An error occurred: {str(e)}", 'danger')
         except Exception as e:
+            db.rollback()
             flash(f"An error occurred: {str(e)}", 'danger')
 
-    return render_template('record_payment.html')
+    return render_template('record_payment.html', idempotency_key=new_key())
 
 @main_bp.route('/admin/create_official', methods=['GET', 'POST'])
 def create_official():
@@ -324,7 +358,7 @@ def fees():
     db = get_db()
     cursor = db.cursor()
     fees_list = cursor.execute('''
-        SELECT f.*, s.name as student_name, s.reg_number as student_reg_number
+        SELECT f.*, f.amount_kobo / 100.0 AS amount, s.name as student_name, s.reg_number as student_reg_number
         FROM fees f
         JOIN students s ON f.student_id = s.id
         ORDER BY f.due_date DESC
@@ -341,6 +375,15 @@ def payments():
     db = get_db()
     cursor = db.cursor()
     payments_list = cursor.execute('''
-        SELECT p.*, s.name as student_name FROM payments p JOIN students s ON p.student_reg_number = s.reg_number ORDER BY p.payment_date DESC
+        SELECT p.*, p.amount_kobo / 100.0 AS amount_paid, s.name as student_name FROM payments p JOIN students s ON p.student_reg_number = s.reg_number ORDER BY p.payment_date DESC
     ''').fetchall()
     return render_template('payments.html', payments=payments_list)
+
+
+@main_bp.route('/admin/render_timings')
+def render_timings():
+    """Per-template render counts and times for this worker process. Only accessible by 'admin' role."""
+    if not is_admin():
+        flash('You do not have permission to view this page.', 'danger')
+        return redirect(url_for('main.login'))
+    return jsonify(instrumentation.timings('template:'))
@@ -1,6 +1,10 @@
 -- This file contains the SQL to create the necessary tables for the application.
 
 -- Drop tables if they exist to allow for a clean schema.
+DROP TABLE IF EXISTS legacy_values;
+DROP TABLE IF EXISTS changelog;
+DROP TABLE IF EXISTS balance_snapshots;
+DROP TABLE IF EXISTS payment_events;
 DROP TABLE IF EXISTS fees;
 DROP TABLE IF EXISTS payments;
 DROP TABLE IF EXISTS students;
@@ -19,7 +23,7 @@ CREATE TABLE students (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     reg_number TEXT UNIQUE NOT NULL,
     name TEXT NOT NULL,
-    dob TEXT,
+    dob DATE,
     gender TEXT,
     address TEXT,
     phone TEXT,
@@ -27,14 +31,14 @@ CREATE TABLE students (
     class TEXT NOT NULL,
     term TEXT NOT NULL,
     academic_year TEXT NOT NULL,
-    admission_date TEXT
+    admission_date DATE
 );
 
 -- Create the fees table to track fees for students.
 CREATE TABLE fees (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     student_id INTEGER NOT NULL,
-    amount REAL NOT NULL,
+    amount_kobo INTEGER NOT NULL,
     due_date DATE NOT NULL,
     is_paid BOOLEAN NOT NULL DEFAULT 0,
     FOREIGN KEY (student_id) REFERENCES students (id)
@@ -46,11 +50,66 @@ CREATE TABLE payments (
     student_reg_number TEXT NOT NULL,
     term TEXT NOT NULL,
     academic_year TEXT NOT NULL,
-    amount_paid REAL NOT NULL,
-    payment_date TEXT NOT NULL,
+    amount_kobo INTEGER NOT NULL,
+    payment_date DATE NOT NULL,
     recorded_by TEXT,
+    client_id TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
     FOREIGN KEY (student_reg_number) REFERENCES students(reg_number) ON DELETE CASCADE
 );
+-- Offline payments and payment forms carry a client-generated id (idempotency key) so
+-- re-uploads and repeated submits are deduplicated.
+CREATE UNIQUE INDEX ux_payments_client_id ON payments (client_id) WHERE client_id IS NOT NULL;
+
+-- Amounts are stored in kobo; these indexes serve date-range and per-period lookups.
+CREATE INDEX ix_payments_payment_date ON payments (payment_date);
+CREATE INDEX ix_payments_student ON payments (student_reg_number, academic_year, term);
+
+-- Append-only history of every payment; balances are the sum of amount_kobo (see app/ledger.py).
+CREATE TABLE payment_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payment_id INTEGER NOT NULL,
+    student_reg_number TEXT NOT NULL,
+    academic_year TEXT,
+    term TEXT,
+    event_type TEXT NOT NULL CHECK(event_type IN ('created', 'reversed', 'corrected')),
+    amount_kobo INTEGER NOT NULL,
+    recorded_by TEXT,
+    recorded_at TIMESTAMP NOT NULL,
+    note TEXT,
+    FOREIGN KEY (payment_id) REFERENCES payments(id)
+);
+CREATE INDEX ix_payment_events_recorded_at ON payment_events (recorded_at);
+CREATE INDEX ix_payment_events_student ON payment_events (student_reg_number, academic_year, term);
+CREATE INDEX ix_payment_events_payment ON payment_events (payment_id);
+
+-- Compacted per-student balances as of a point in time, so replays start from the nearest one.
+CREATE TABLE balance_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    as_of TIMESTAMP NOT NULL UNIQUE,
+    last_event_id INTEGER,
+    entries INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+
+-- Original text of legacy values a migration couldn't convert (see migrate_money_and_dates).
+CREATE TABLE legacy_values (
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    column_name TEXT NOT NULL,
+    raw_value TEXT NOT NULL,
+    PRIMARY KEY (table_name, row_id, column_name)
+);
+
+-- One entry per changed row with a monotonically increasing sequence number, kept up to
+-- date by the triggers in app/models.py (CHANGELOG_TRIGGERS); read by /api/v1/sync.
+CREATE TABLE changelog (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    op TEXT NOT NULL CHECK(op IN ('upsert', 'delete'))
+);
+CREATE UNIQUE INDEX ux_changelog_row ON changelog (table_name, row_key);
 
 -- Insert a default admin user with a freshly generated password hash for 'adminpassword'.
 INSERT INTO users (username, password, role) VALUES ('admin', '$2b$12$e68YxG6B5x9p7s9g2e4U5O.nQ2zE3s6tD.q5.h9d3w3y.j8a.c6u4q.', 'admin');
\ No newline at end of file
@@ -0,0 +1,112 @@
+# app/statements.py
+# Payment receipts and term statements, as HTML or PDF. Everything here works on plain
+# dicts, so callers fetch the data (one query for a whole class) and PDF rendering can be
+# spread over a process pool. The HTML pages are app templates (receipt.html and
+# statement.html), rendered with render_template in the request's process.
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from flask import render_template
+
+from .pdf import render_pdf
+
+SCHOOL_NAME = "Alfurqan Academy Mai'adua"
+
+
+def format_naira(value):
+    return '{:,.2f}'.format(Decimal(value))
+
+
+def _totals(fee_breakdown):
+    return {key: sum((data[key] for data in fee_breakdown.values()), Decimal(0))
+            for key in ('expected', 'paid', 'outstanding')}
+
+
+def receipt_html(receipt):
+    return render_template('receipt.html', school=SCHOOL_NAME, **receipt)
+
+
+def receipt_pdf(receipt):
+    student, payment, period = receipt['student'], receipt['payment'], receipt['period']
+    return render_pdf([
+        (SCHOOL_NAME, 16, True),
+        (f"Payment Receipt #{payment['id']}", 13, True),
+        '',
+        f"Student: {student['name']} ({student['reg_number']})",
+        f"Class: {student['student_class']}",
+        f"Period: {payment['term']} {payment['academic_year']}",
+        f"Date: {payment['payment_date']}",
+        (f"Amount Paid: ₦{format_naira(payment['amount'])}", 11, True),
+        f"Paid for Period: ₦{format_naira(period['paid'])}",
+        'Outstanding: n/a' if period['outstanding'] is None else f"Outstanding: ₦{format_naira(period['outstanding'])}",
+    ], title=f"Receipt {payment['id']}")
+
+
+def statement_html(statement):
+    return render_template('statement.html', school=SCHOOL_NAME, totals=_totals(statement['fee_breakdown']),
+                           **statement)
+
+
+def statement_pdf(statement):
+    student = statement['student']
+    lines = [
+        (SCHOOL_NAME, 16, True),
+        (f"Statement of Account - {statement['term']} {statement['academic_year']}", 13, True),
+        f"{student['name']} ({student['reg_number']}), {student['student_class']}",
+        '',
+        ('Period', 10, True, 0), ('Expected', 10, True, 220), ('Paid', 10, True, 310), ('Outstanding', 10, True, 400),
+    ]
+    rows = list(statement['fee_breakdown'].items()) + [('Total', _totals(statement['fee_breakdown']))]
+    for period, data in rows:
+        lines += [(period, 10, period == 'Total', 0),
+                  (format_naira(data['expected']), 10, False, 220),
+                  (format_naira(data['paid']), 10, False, 310),
+                  (format_naira(data['outstanding']), 10, False, 400)]
+    return render_pdf(lines, title=f"Statement {student['reg_number']}")
+
+
+RENDERERS = {'html': statement_html, 'pdf': statement_pdf}
+
+
+def _render_chunk(args):
+    fmt, statements = args
+    render = RENDERERS[fmt]
+    return [(_filename(s, fmt), render(s)) for s in statements]
+
+
+def _filename(statement, fmt):
+    reg = statement['student']['reg_number'].replace('/', '-')
+    return f"{reg}_{statement['term'].replace(' ', '')}_{statement['academic_year'].replace('/', '-')}.{fmt}"
+
+
+def _write(bundle, rendered_chunks):
+    for results in rendered_chunks:
+        for name, content in results:
+            bundle.writestr(name, content)
+
+
+def render_bundle(statements, fmt='pdf', processes=None, chunk_size=250):
+    """
+    Renders statements into a zip archive, spreading PDF chunks of chunk_size over a
+    process pool (a single chunk renders in-process, as starting workers would cost more).
+    HTML renders in-process, since its templates belong to the current app.
+    Returns (zip bytes, statements per second).
+    """
+    if fmt not in RENDERERS:
+        raise ValueError(f'Unknown statement format {fmt!r}')
+    started = time.perf_counter()
+    chunks = [(fmt, statements[i:i + chunk_size]) for i in range(0, len(statements), chunk_size)]
+    processes = processes or os.cpu_count() or 1
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        if fmt == 'html' or processes == 1 or len(chunks) <= 1:
+            _write(bundle, map(_render_chunk, chunks))
+        else:
+            with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as pool:
+                _write(bundle, pool.map(_render_chunk, chunks))
+    elapsed = time.perf_counter() - started
+    return buffer.getvalue(), len(statements) / elapsed if elapsed else float('inf')
@@ -0,0 +1,98 @@
+# benchmarks/analytics.py
+# /analytics in app.py over a large ledger: time to build the report from the database
+# (cold) and response times once it is cached, as JSON and HTML.
+#
+#   python benchmarks/analytics.py [payments] [students]
+import importlib.util
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+
+def load_app(instance):
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(instance, 'analytics.sqlite')}", ALFURQAN_DESKTOP='1')
+    spec = importlib.util.spec_from_file_location('app_single', os.path.join(ROOT, 'app.py'))
+    single = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(single)
+    return single, single.create_app()
+
+
+def seed(single, path, payments, students):
+    classes = sorted({cls for cls, _ in single.FEE_STRUCTURE})
+    current_year, _ = single.get_current_school_period()
+    start = int(current_year.split('/')[0])
+    years = [f'{y}/{y + 1}' for y in range(start - 2, start + 1)]
+    terms = single.TERM_ORDER
+    rng = random.Random(39)
+    connection = sqlite3.connect(path)
+    connection.execute("INSERT INTO users (id, username, password, role) VALUES (1, 'admin', '-', 'admin')")
+    connection.executemany(
+        'INSERT INTO students (reg_number, name, student_class, term, academic_year) VALUES (?, ?, ?, ?, ?)',
+        ((f'AFA/{i:06d}', f'Student {i}', classes[i % len(classes)], terms[0], years[i % 3]) for i in range(students)))
+    connection.executemany('''
+        INSERT INTO payment_events (payment_id, student_reg_number, academic_year, term, event_type,
+                                    amount_kobo, recorded_by, recorded_at)
+        VALUES (?, ?, ?, ?, 'created', ?, 1, '2025-01-01 00:00:00')
+    ''', ((i, f'AFA/{rng.randrange(students):06d}', rng.choice(years), rng.choice(terms),
+           rng.randrange(500, 30_000) * 100) for i in range(payments)))
+    connection.commit()
+    connection.close()
+
+
+def main(payments=1_000_000, students=50_000):
+    instance = tempfile.mkdtemp()
+    try:
+        single, app = load_app(instance)
+        with app.app_context():
+            single.db.create_all()
+            path = single.db.engine.url.database
+        started = time.perf_counter()
+        seed(single, path, payments, students)
+        print(f'seeded {payments:,} payments for {students:,} students in {time.perf_counter() - started:.1f}s')
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session.update(_user_id='1', _fresh=True)
+
+        started = time.perf_counter()
+        response = client.get('/analytics?format=json')
+        cold_ms = (time.perf_counter() - started) * 1000
+        data = response.get_json()
+        print(f"{'cold: query, pack and aggregate':36s} {cold_ms:9.1f}ms  ({data['cells']:,} student-period cells, "
+              f"{len(data['pivot'])} pivot rows)")
+        for label, url in (('cached, JSON', '/analytics?format=json'), ('cached, HTML', '/analytics')):
+            timings = []
+            for _ in range(20):
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            print(f'{label:36s} {timings[len(timings) // 2]:9.1f}ms median, {timings[-1]:.1f}ms max '
+                  f'({len(response.get_data()):,} bytes)')
+
+        from app.analytics import report
+        with app.test_request_context():
+            current_year, current_term = single.get_current_school_period()
+            start = int(current_year.split('/')[0])
+            cells = single.analytics_cells([f'{y}/{y + 1}' for y in range(start - 2, start + 1)])
+        fees = {period: single.to_kobo(amount) for period, amount in single.FEE_STRUCTURE.items()}
+        started = time.perf_counter()
+        report(cells, fees, (current_year, current_term))
+        print(f"{'aggregation alone (arrays, pivot, pct)':36s} {(time.perf_counter() - started) * 1000:9.1f}ms")
+        with app.app_context():
+            single.db.engine.dispose()
+    finally:
+        shutil.rmtree(instance)
+    return 0
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    sys.exit(main(*args))
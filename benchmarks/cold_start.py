@@ -0,0 +1,85 @@
+# benchmarks/cold_start.py
+# Measures desktop cold start: process launch to the first rendered page, the student
+# overview an office user lands on after signing in (so templates are loaded and compiled
+# on the way). Runs headless, so it works on a Linux CI box without a display. Any error
+# response fails the run.
+#
+#   python benchmarks/cold_start.py [runs]
+import http.cookiejar
+import os
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+from werkzeug.security import generate_password_hash
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LOGIN = {'username': 'bench', 'password': 'bench-password'}
+
+
+def seed(bundled_db):
+    """An admin to sign in with and a few students for the overview, in the bundled database."""
+    connection = sqlite3.connect(bundled_db)
+    connection.execute("INSERT INTO users (username, password, role) VALUES (?, ?, 'admin')",
+                       (LOGIN['username'], generate_password_hash(LOGIN['password'])))
+    connection.executemany('INSERT INTO students (reg_number, name, student_class, term, academic_year) '
+                           "VALUES (?, ?, 'JSS 1', 'First Term', '2025/2026')",
+                           [(f'AFA-{i:04d}', f'Student {i}') for i in range(5)])
+    connection.commit()
+    connection.close()
+
+
+def first_page(url):
+    """Signs in and follows the redirect to the overview; HTTPError on any error response."""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    with opener.open(url + 'login', data=urllib.parse.urlencode(LOGIN).encode()) as response:
+        body = response.read()
+        if response.status != 200 or urllib.parse.urlsplit(response.url).path != '/':
+            raise RuntimeError(f'Expected the overview after signing in, got {response.status} {response.url}')
+    return body
+
+
+def cold_start(instance_path, bundled_db):
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'desktop.py'), '--headless', '--instance-path', instance_path],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, cwd=ROOT,
+        env={**os.environ, 'ALFURQAN_BUNDLED_DB': bundled_db},
+    )
+    try:
+        for line in proc.stdout:
+            match = re.search(r'Serving (http://\S+)', line)
+            if match:
+                first_page(match.group(1))
+                return time.perf_counter() - started
+        raise RuntimeError('desktop.py exited before serving')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(runs=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        bundled_db = os.path.join(tmp, 'bundle', 'alfurqan_academy.db')
+        subprocess.run([sys.executable, os.path.join(ROOT, 'desktop.py'), '--build-db', bundled_db],
+                       check=True, capture_output=True, cwd=ROOT)
+        seed(bundled_db)
+        results = {'first launch (copies bundled db)': [], 'later launch': []}
+        for i in range(runs):
+            instance_path = os.path.join(tmp, f'run{i}')
+            results['first launch (copies bundled db)'].append(cold_start(instance_path, bundled_db))
+            results['later launch'].append(cold_start(instance_path, bundled_db))
+    for name, timings in results.items():
+        print(f'{name:34s} median {statistics.median(timings) * 1000:7.1f}ms  '
+              f'min {min(timings) * 1000:7.1f}ms  max {max(timings) * 1000:7.1f}ms')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
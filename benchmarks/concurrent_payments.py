@@ -0,0 +1,195 @@
+# benchmarks/concurrent_payments.py
+# Concurrent-writer harness for payment recording. Starts N threads at once (default 50)
+# against a fresh database and checks the invariants rather than timing:
+#   - the same payment form or API batch submitted N times posts exactly one payment;
+#   - N different submissions post exactly N payments with matching ledger totals;
+#   - N officials correcting the same payment concurrently lose no update (each retries
+#     on a version conflict, and every increment ends up in the balance).
+# Runs against the app package and the single-file app.py.
+#
+#   python benchmarks/concurrent_payments.py [threads]
+import importlib.util
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app, get_db, ledger
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+FORM = {'student_reg_number': 'AFA-0001', 'amount_paid': '5000', 'payment_date': '2025-10-01',
+        'term': 'First Term', 'academic_year': '2025/2026'}
+
+
+def run_concurrently(threads, work):
+    """Calls work(i) on `threads` threads released together; returns (results, seconds)."""
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def target(i):
+        barrier.wait()
+        results[i] = work(i)
+
+    workers = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results, time.perf_counter() - started
+
+
+def check(label, ok, detail, seconds):
+    print(f"  {'ok  ' if ok else 'FAIL'} {label:55s} {detail:28s} {seconds * 1000:8.1f}ms")
+    return ok
+
+
+def package_checks(threads, instance):
+    app = create_app({'SECRET_KEY': 'bench', 'TEMPLATE_PRELOAD': False, 'DATABASE_AUTO_MIGRATE': True},
+                     instance_path=instance)
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO students (reg_number, name, class, term, academic_year) "
+                   "VALUES ('AFA-0001', 'Student', 'JSS 1', 'First Term', '2025/2026')")
+        db.commit()
+
+    def client():
+        c = app.test_client()
+        with c.session_transaction() as session:
+            session.update(user_id=1, username='official', role='official')
+        return c
+
+    def count(where='1 = 1', params=()):
+        with app.app_context():
+            return get_db().execute(f'SELECT COUNT(*) FROM payments WHERE {where}', params).fetchone()[0]
+
+    ok = True
+    clients = [client() for _ in range(threads)]
+    _, seconds = run_concurrently(threads, lambda i: clients[i].post(
+        '/record_payment', data={**FORM, 'idempotency_key': 'same-form'}).status_code)
+    posted = count('client_id = ?', ('same-form',))
+    ok &= check(f'app package: one form submitted {threads}x', posted == 1, f'{posted} payment(s)', seconds)
+
+    _, seconds = run_concurrently(threads, lambda i: clients[i].post(
+        '/record_payment', data={**FORM, 'idempotency_key': f'form-{i}'}).status_code)
+    posted = count("client_id LIKE 'form-%'")
+    ok &= check(f'app package: {threads} different forms', posted == threads, f'{posted} payment(s)', seconds)
+
+    batch = {'payments': [{'student_reg_number': 'AFA-0001', 'amount': '2500', 'payment_date': '2025-10-02',
+                           'term': 'First Term', 'academic_year': '2025/2026'}]}
+    key = str(uuid.uuid4())
+    statuses, seconds = run_concurrently(threads, lambda i: clients[i].post(
+        '/api/v1/payments/batch', json=batch, headers={'Idempotency-Key': key}).status_code)
+    posted = count('client_id = ?', (f'{key}:0',))
+    ok &= check(f'API: one batch sent {threads}x with Idempotency-Key', posted == 1 and set(statuses) == {201},
+                f'{posted} payment(s)', seconds)
+
+    with app.app_context():
+        payment_id = get_db().execute('SELECT id FROM payments WHERE client_id = ?', ('same-form',)).fetchone()[0]
+        before = ledger.payment_amount(get_db(), payment_id)
+    conflicts = [0]
+
+    def add_100_naira(i):
+        connection = sqlite3.connect(app.config['DATABASE'], timeout=30)
+        try:
+            while True:
+                version, current = ledger.payment_state(connection, payment_id)
+                try:
+                    ledger.correct_payment(connection, payment_id, current + 10_000, f'official-{i}',
+                                           expected_version=version)
+                    connection.commit()
+                    return
+                except ledger.StaleUpdate:
+                    connection.rollback()
+                    conflicts[0] += 1
+        finally:
+            connection.close()
+
+    _, seconds = run_concurrently(threads, add_100_naira)
+    with app.app_context():
+        after = ledger.payment_amount(get_db(), payment_id)
+    ok &= check(f'app package: {threads} concurrent corrections (+N100 each)', after - before == threads * 10_000,
+                f'+{(after - before) // 100:,} naira, {conflicts[0]} retries', seconds)
+    return ok
+
+
+def single_file_checks(threads, instance):
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(instance, 'single.sqlite')}", ALFURQAN_DESKTOP='1')
+    spec = importlib.util.spec_from_file_location('app_single', os.path.join(ROOT, 'app.py'))
+    single = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(single)
+    app = single.create_app()
+    db = single.db
+    with app.app_context():
+        db.create_all()
+        db.session.add(single.User(username='admin', password='-', role='admin'))
+        db.session.add(single.Student(reg_number='AFA-0001', name='Student', student_class='JSS 1',
+                                      term='First Term', academic_year='2025/2026'))
+        db.session.commit()
+
+    def client():
+        c = app.test_client()
+        with c.session_transaction() as session:
+            session.update(_user_id='1', _fresh=True)
+        return c
+
+    ok = True
+    clients = [client() for _ in range(threads)]
+    # The key the rendered form carries, as a browser resubmitting that form would send it.
+    page = clients[0].get('/make_payment/AFA-0001').get_data(as_text=True)
+    key = re.search(r'name="idempotency_key" value="([^"]+)"', page).group(1)
+    form = {'amount_paid': '5000', 'term': 'First Term', 'academic_year': '2025/2026', 'idempotency_key': key}
+    _, seconds = run_concurrently(threads, lambda i: clients[i].post('/make_payment/AFA-0001', data=form).status_code)
+    with app.app_context():
+        posted = single.Payment.query.filter_by(idempotency_key=key).count()
+        payment_id = single.Payment.query.filter_by(idempotency_key=key).first().id
+        before = single.current_amount_kobo(db.session.get(single.Payment, payment_id))
+    ok &= check(f'app.py: one form submitted {threads}x', posted == 1, f'{posted} payment(s)', seconds)
+
+    conflicts = [0]
+
+    def add_100_naira(i):
+        with app.app_context():
+            while True:
+                payment = db.session.get(single.Payment, payment_id)
+                version, current = payment.version, single.current_amount_kobo(payment)
+                try:
+                    single.correct_payment(payment, single.from_kobo(current + 10_000), 1, expected_version=version)
+                    db.session.commit()
+                    return
+                except single.StaleDataError:
+                    db.session.rollback()
+                    conflicts[0] += 1
+                finally:
+                    db.session.expire_all()
+
+    _, seconds = run_concurrently(threads, add_100_naira)
+    with app.app_context():
+        after = single.current_amount_kobo(db.session.get(single.Payment, payment_id))
+        engine = db.engine
+    ok &= check(f'app.py: {threads} concurrent corrections (+N100 each)', after - before == threads * 10_000,
+                f'+{(after - before) // 100:,} naira, {conflicts[0]} retries', seconds)
+    engine.dispose()
+    return ok
+
+
+def main(threads=50):
+    instance = tempfile.mkdtemp()
+    try:
+        print(f'{threads} concurrent submitters')
+        ok = package_checks(threads, instance)
+        ok = single_file_checks(threads, instance) and ok
+    finally:
+        shutil.rmtree(instance)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
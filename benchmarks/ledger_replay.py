@@ -0,0 +1,79 @@
+# benchmarks/ledger_replay.py
+# Replays a synthetic payment event log and compares reconstructing balances at a past
+# moment from the nearest snapshot against replaying the whole history.
+#
+#   python benchmarks/ledger_replay.py [number_of_events]
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import ledger
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', 'app', 'schema.sql')
+TERMS = ('First Term', 'Second Term', 'Third Term')
+
+
+def build_log(db, count, students=5000, seed=7):
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 9, 1)
+    step = datetime.timedelta(days=365) / count
+    rows = []
+    for i in range(count):
+        payment_id = i + 1
+        reg_number = f'ALF/{rng.randrange(students):05d}'
+        term = TERMS[rng.randrange(3)]
+        recorded_at = (start + step * i).isoformat(sep=' ', timespec='microseconds')
+        # Mostly new payments, with the occasional reversal or correction.
+        roll = rng.random()
+        event_type = 'created' if roll < 0.97 else ('reversed' if roll < 0.985 else 'corrected')
+        amount = rng.randint(1_000, 5_000_000) * (-1 if event_type == 'reversed' else 1)
+        rows.append((payment_id, reg_number, '2024/2025', term, event_type, amount, 'bench', recorded_at))
+        if len(rows) == 100_000:
+            db.executemany('INSERT INTO payment_events (payment_id, student_reg_number, academic_year, term, '
+                           'event_type, amount_kobo, recorded_by, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            rows = []
+    db.executemany('INSERT INTO payment_events (payment_id, student_reg_number, academic_year, term, '
+                   'event_type, amount_kobo, recorded_by, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    db.commit()
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f'{label:45s} {(time.perf_counter() - started) * 1000:9.1f}ms')
+    return result
+
+
+def main(count=2_000_000):
+    db = sqlite3.connect(':memory:')
+    with open(SCHEMA) as f:
+        db.executescript(f.read())
+    timed(f'build {count:,} events', lambda: build_log(db, count))
+
+    target = datetime.datetime(2025, 6, 20, 15, 30)
+    full = timed('balances_at, no snapshots (full replay)', lambda: ledger.balances_at(db, target))
+
+    def monthly_snapshots():
+        for month in range(1, 13):
+            year = 2024 if month >= 9 else 2025
+            ledger.take_snapshot(db, datetime.datetime(year, month, 1))
+    timed('take 12 monthly snapshots', monthly_snapshots)
+    sizes = db.execute('SELECT AVG(entries), AVG(LENGTH(data)) FROM balance_snapshots').fetchone()
+    print(f'average snapshot: {sizes[0]:,.0f} balances in {sizes[1] / 1024:,.1f} KiB')
+
+    from_snapshot = timed('balances_at, from nearest snapshot', lambda: ledger.balances_at(db, target))
+    assert from_snapshot == full, 'snapshot replay disagrees with full replay'
+
+    key = next(iter(full))
+    single = timed('balance_at one student, from snapshot', lambda: ledger.balance_at(db, *key, target))
+    assert single == full[key]
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000))
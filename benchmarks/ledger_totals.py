@@ -0,0 +1,180 @@
+# benchmarks/ledger_totals.py
+# Exact money on a million-payment ledger, end to end. Seeds a database in the original
+# schema (REAL amounts, free-text dates), upgrades it with the real migration code and
+# checks per-student and grand totals against an exact Decimal reference, read through
+# the queries the apps report from:
+#   - the app package: migrated by create_app(DATABASE_AUTO_MIGRATE=True), read through
+#     POST /api/v1/fee-status and the admin dashboard;
+#   - app.py: migrated by normalize_legacy_columns() (`flask normalize-ledger`), read
+#     through total_paid_kobo() (fee status, receipts) and /analytics.
+# Also shows how far the old REAL column's sum had drifted.
+#
+#   python benchmarks/ledger_totals.py [number_of_payments]
+import importlib.util
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import template_rendered
+
+from app import create_app
+from app.conversions import from_kobo
+from legacy_migration import LEGACY_SCHEMA
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+STUDENTS = 2000
+# app.py's tables before dates and money had proper types.
+SINGLE_FILE_LEGACY_SCHEMA = '''
+CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(120) NOT NULL UNIQUE,
+                    password VARCHAR(128) NOT NULL, role VARCHAR(20));
+CREATE TABLE students (id INTEGER PRIMARY KEY, reg_number VARCHAR(50) NOT NULL UNIQUE, name VARCHAR(120) NOT NULL,
+                       dob VARCHAR(20), gender VARCHAR(10), address VARCHAR(255), phone VARCHAR(20),
+                       email VARCHAR(120), student_class VARCHAR(50), term VARCHAR(50),
+                       academic_year VARCHAR(20), admission_date VARCHAR(20));
+CREATE TABLE payments (id INTEGER PRIMARY KEY, student_reg_number VARCHAR(50) NOT NULL REFERENCES students (reg_number),
+                       term VARCHAR(50), academic_year VARCHAR(20), amount_paid FLOAT, payment_date VARCHAR(20),
+                       recorded_by INTEGER NOT NULL REFERENCES users (id));
+'''
+
+
+def ledger(count, seed=42):
+    """(reg_number, naira) for each payment, and the exact Decimal total per student."""
+    rng = random.Random(seed)
+    payments, reference = [], {}
+    for i in range(count):
+        reg_number = f'ALF/{i % STUDENTS:05d}'
+        # Amounts with kobo, e.g. 12345.67, the kind that floats can't represent exactly.
+        naira = Decimal(rng.randint(100, 8_000_000)) / 100
+        payments.append((reg_number, naira))
+        reference[reg_number] = reference.get(reg_number, Decimal(0)) + naira
+    return payments, reference
+
+
+def real_drift(path, reference):
+    total, = sqlite3.connect(path).execute('SELECT SUM(amount_paid) FROM payments').fetchone()
+    return Decimal(repr(total)) - sum(reference.values(), Decimal(0))
+
+
+def check(label, ok, detail):
+    print(f"  {'ok  ' if ok else 'FAIL'} {label:48s} {detail}")
+    return ok
+
+
+def package_checks(instance, payments, reference):
+    path = os.path.join(instance, 'database.db')
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.executemany('INSERT INTO students (reg_number, name, class, term, academic_year) VALUES (?, ?, ?, ?, ?)',
+                           [(reg_number, reg_number, 'JSS 1', 'First Term', '2025/2026') for reg_number in reference])
+    connection.executemany('INSERT INTO payments (student_reg_number, payment_date, amount_paid, term, academic_year, '
+                           "recorded_by) VALUES (?, '01/10/2025', ?, 'First Term', '2025/2026', 'admin')",
+                           [(reg_number, float(naira)) for reg_number, naira in payments])
+    connection.commit()
+    connection.close()
+    print(f'app package: REAL sum drift before migrating {real_drift(path, reference)}')
+
+    started = time.perf_counter()
+    app = create_app({'SECRET_KEY': 'bench', 'TEMPLATE_PRELOAD': False, 'DATABASE_AUTO_MIGRATE': True,
+                      'METRICS_DIR': None, 'DATABASE': path}, instance_path=instance)
+    print(f'app package: migrated {len(payments):,} payments in {time.perf_counter() - started:.2f}s')
+
+    c = app.test_client()
+    with c.session_transaction() as session:
+        session.update(user_id=1, username='admin', role='admin')
+    started = time.perf_counter()
+    paid = {}
+    reg_numbers = list(reference)
+    for i in range(0, len(reg_numbers), 1000):
+        paid.update(c.post('/api/v1/fee-status', json={'reg_numbers': reg_numbers[i:i + 1000]}).get_json()['data'])
+    mismatches = [reg for reg, total in reference.items() if Decimal(paid[reg]['paid']) != total]
+    ok = check('per-student totals (POST /api/v1/fee-status)', not mismatches,
+               f'{len(mismatches)} mismatches, {(time.perf_counter() - started) * 1000:.0f}ms')
+
+    rendered = []
+
+    def record(sender, template, context, **extra):
+        rendered.append(context)
+
+    started = time.perf_counter()
+    with template_rendered.connected_to(record, app):
+        status = c.get('/dashboard').status_code
+    received = rendered[-1]['total_received_revenue'] if rendered else None
+    expected = sum(reference.values(), Decimal(0))
+    ok &= check('grand total (admin dashboard)', status == 200 and received == expected,
+                f'{received} in {(time.perf_counter() - started) * 1000:.0f}ms')
+    return ok
+
+
+def single_file_checks(instance, payments, reference):
+    path = os.path.join(instance, 'single.sqlite')
+    os.environ.update(DATABASE_URL=f'sqlite:///{path}', ALFURQAN_DESKTOP='1', METRICS_DIR='', TEMPLATE_PRELOAD='0',
+                      TEMPLATE_CACHE_DIR='')
+    spec = importlib.util.spec_from_file_location('app_single', os.path.join(ROOT, 'app.py'))
+    single = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(single)
+    year, term = single.get_current_school_period()
+
+    connection = sqlite3.connect(path)
+    connection.executescript(SINGLE_FILE_LEGACY_SCHEMA)
+    connection.execute("INSERT INTO users (id, username, password, role) VALUES (1, 'admin', '-', 'admin')")
+    connection.executemany('INSERT INTO students (reg_number, name, student_class, term, academic_year, admission_date) '
+                           "VALUES (?, ?, 'JSS 1', ?, ?, '01/09/2025')",
+                           [(reg_number, reg_number, term, year) for reg_number in reference])
+    connection.executemany('INSERT INTO payments (student_reg_number, term, academic_year, amount_paid, payment_date, '
+                           "recorded_by) VALUES (?, ?, ?, ?, '01/10/2025', 1)",
+                           [(reg_number, term, year, float(naira)) for reg_number, naira in payments])
+    connection.commit()
+    connection.close()
+    print(f'app.py: REAL sum drift before migrating {real_drift(path, reference)}')
+
+    app = single.create_app()
+    started = time.perf_counter()
+    with app.app_context():
+        single.normalize_legacy_columns()
+    print(f'app.py: migrated {len(payments):,} payments in {time.perf_counter() - started:.2f}s')
+
+    started = time.perf_counter()
+    with app.app_context():
+        mismatches = [reg for reg, total in reference.items()
+                      if from_kobo(single.total_paid_kobo(reg, year, term)) != total]
+        engine = single.db.engine
+    ok = check('per-student totals (fee status query)', not mismatches,
+               f'{len(mismatches)} mismatches, {(time.perf_counter() - started) * 1000:.0f}ms')
+
+    c = app.test_client()
+    with c.session_transaction() as session:
+        session.update(_user_id='1', _fresh=True)
+    started = time.perf_counter()
+    response = c.get('/analytics?format=json&years=1')
+    received = from_kobo(sum(row['received_kobo'] for row in response.get_json()['pivot'])) \
+        if response.status_code == 200 else None
+    expected = sum(reference.values(), Decimal(0))
+    ok &= check('grand total (/analytics)', received == expected,
+                f'{received} in {(time.perf_counter() - started) * 1000:.0f}ms')
+    engine.dispose()
+    return ok
+
+
+def main(count=1_000_000):
+    started = time.perf_counter()
+    payments, reference = ledger(count)
+    print(f'{count:,} payments for {STUDENTS:,} students, exact total {sum(reference.values(), Decimal(0))} '
+          f'({time.perf_counter() - started:.2f}s)')
+    instance = tempfile.mkdtemp()
+    try:
+        ok = package_checks(instance, payments, reference)
+        ok = single_file_checks(instance, payments, reference) and ok
+    finally:
+        shutil.rmtree(instance)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
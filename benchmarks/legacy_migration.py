@@ -0,0 +1,100 @@
+# benchmarks/legacy_migration.py
+# Upgrades a database in the original schema (REAL money columns, free-text dates, no
+# schema version) through every migration with `create_app(DATABASE_AUTO_MIGRATE=True)`,
+# the same path as `flask init-db`, and checks the result: amounts carried over to kobo,
+# dates in ISO form, one 'created' event per payment, and the changelog seeded.
+#
+#   python benchmarks/legacy_migration.py [payments]
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app, get_db, models
+from app.conversions import to_kobo
+
+LEGACY_SCHEMA = '''
+CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL UNIQUE,
+                    password TEXT NOT NULL, role TEXT NOT NULL);
+CREATE TABLE students (id INTEGER PRIMARY KEY AUTOINCREMENT, reg_number TEXT NOT NULL UNIQUE,
+                       name TEXT NOT NULL, class TEXT NOT NULL, term TEXT NOT NULL, academic_year TEXT NOT NULL);
+CREATE TABLE fees (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER, amount REAL, due_date TEXT,
+                   FOREIGN KEY (student_id) REFERENCES students (id));
+CREATE TABLE payments (id INTEGER PRIMARY KEY AUTOINCREMENT, student_reg_number TEXT, payment_date TEXT,
+                       amount_paid REAL, term TEXT, academic_year TEXT, recorded_by TEXT,
+                       FOREIGN KEY (student_reg_number) REFERENCES students (reg_number));
+'''
+# The same day written the ways the old free-text column received it.
+DATE_SPELLINGS = ('2025-10-01', '01/10/2025', '01-10-2025', '2025/10/01')
+
+
+def build_legacy(path, payments, students=1000):
+    rng = random.Random(40)
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.execute("INSERT INTO users (username, password, role) VALUES ('admin', '-', 'admin')")
+    connection.executemany('INSERT INTO students (reg_number, name, class, term, academic_year) VALUES (?, ?, ?, ?, ?)',
+                           [(f'AFA-{i:05d}', f'Student {i}', 'JSS 1', 'First Term', '2025/2026')
+                            for i in range(students)])
+    connection.executemany('INSERT INTO fees (student_id, amount, due_date) VALUES (?, ?, ?)',
+                           [(i + 1, 70000.0, rng.choice(DATE_SPELLINGS)) for i in range(students)])
+    rows = [(f'AFA-{rng.randrange(students):05d}', rng.choice(DATE_SPELLINGS), rng.randrange(100, 70_000) + 0.1 * rng.randrange(10),
+             'First Term', '2025/2026', 'admin') for _ in range(payments)]
+    connection.executemany('INSERT INTO payments (student_reg_number, payment_date, amount_paid, term, '
+                           'academic_year, recorded_by) VALUES (?, ?, ?, ?, ?, ?)', rows)
+    connection.commit()
+    connection.close()
+    return sum(to_kobo(repr(row[2])) for row in rows)
+
+
+def check(label, ok, detail):
+    print(f"  {'ok  ' if ok else 'FAIL'} {label:44s} {detail}")
+    return ok
+
+
+def main(payments=50_000):
+    instance = tempfile.mkdtemp()
+    try:
+        path = os.path.join(instance, 'database.db')
+        expected_kobo = build_legacy(path, payments)
+        started = time.perf_counter()
+        app = create_app({'SECRET_KEY': 'bench', 'TEMPLATE_PRELOAD': False, 'DATABASE_AUTO_MIGRATE': True,
+                          'METRICS_DIR': None, 'DATABASE': path}, instance_path=instance)
+        seconds = time.perf_counter() - started
+        print(f'migrated {payments:,} legacy payments to schema version {models.SCHEMA_VERSION} in {seconds:.2f}s')
+
+        with app.app_context():
+            db = get_db()
+            version = models.schema_version(db)
+            kobo, = db.execute('SELECT SUM(amount_kobo) FROM payments').fetchone()
+            event_count, event_kobo = db.execute(
+                "SELECT COUNT(*), SUM(amount_kobo) FROM payment_events WHERE event_type = 'created'").fetchone()
+            odd_dates, = db.execute("SELECT COUNT(*) FROM payments WHERE payment_date <> '2025-10-01'").fetchone()
+            odd_due, = db.execute("SELECT COUNT(*) FROM fees WHERE due_date <> '2025-10-01'").fetchone()
+            changelog, = db.execute("SELECT COUNT(*) FROM changelog WHERE table_name = 'payments'").fetchone()
+            columns = {row[1] for row in db.execute('PRAGMA table_info(payments)')}
+
+        ok = check('schema version', version == models.SCHEMA_VERSION, f'{version}')
+        ok &= check('amounts carried over to kobo', kobo == expected_kobo, f'{kobo:,} kobo')
+        ok &= check('legacy amount_paid column removed', 'amount_paid' not in columns, '')
+        ok &= check('dates normalized', odd_dates == odd_due == 0, f'{odd_dates + odd_due} left over')
+        ok &= check("one 'created' event per payment", event_count == payments and event_kobo == kobo,
+                    f'{event_count:,} events')
+        ok &= check('changelog seeded', changelog == payments, f'{changelog:,} rows')
+
+        started = time.perf_counter()
+        create_app({'SECRET_KEY': 'bench', 'TEMPLATE_PRELOAD': False, 'METRICS_DIR': None, 'DATABASE': path},
+                   instance_path=instance)
+        print(f'next boot (version check only): {(time.perf_counter() - started) * 1000:.1f}ms')
+    finally:
+        shutil.rmtree(instance)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000))
@@ -0,0 +1,123 @@
+# benchmarks/metrics.py
+# /metrics under several worker processes, the way gunicorn runs the app package: forks
+# N workers that each answer requests and record payments, then scrapes /metrics from the
+# parent and checks the totals against what the workers did and what the database holds.
+# Also reports what recording metrics adds to a request.
+#
+#   python benchmarks/metrics.py [workers] [requests per worker]
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app, get_db
+
+CONFIG = {'SECRET_KEY': 'bench', 'TEMPLATE_PRELOAD': False, 'DATABASE_AUTO_MIGRATE': True}
+PAYMENT = {'student_reg_number': 'AFA-00001', 'amount': '2500', 'payment_date': '2025-10-01',
+           'term': 'First Term', 'academic_year': '2025/2026'}
+
+
+def seed(app):
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO students (reg_number, name, class, term, academic_year) VALUES (?, ?, ?, ?, ?)',
+                       [(f'AFA-{i:05d}', f'Student {i}', 'JSS 1', 'First Term', '2025/2026') for i in range(1, 501)])
+        db.commit()
+
+
+def client(app):
+    c = app.test_client()
+    with c.session_transaction() as session:
+        session.update(user_id=1, username='official', role='official')
+    return c
+
+
+def sample(text, name, **labels):
+    """Value of one sample in a scrape (0 if absent)."""
+    wanted = ','.join(f'{label}="{value}"' for label, value in labels.items())
+    pattern = re.escape(f'{name}{{{wanted}}}' if wanted else name) + r' (\S+)'
+    match = re.search(f'^{pattern}$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0
+
+
+def per_request_ms(app, url, runs=500):
+    c = client(app)
+    c.get(url)
+    started = time.perf_counter()
+    for _ in range(runs):
+        c.get(url)
+    return (time.perf_counter() - started) * 1000 / runs
+
+
+def check(label, ok, detail):
+    print(f"  {'ok  ' if ok else 'FAIL'} {label:48s} {detail}")
+    return ok
+
+
+def main(workers=4, requests=250):
+    if not hasattr(os, 'fork'):
+        print('Forked workers need a POSIX system (as gunicorn does).')
+        return 1
+    instance = tempfile.mkdtemp()
+    try:
+        app = create_app(CONFIG, instance_path=instance)
+        seed(app)
+        pids = []
+        started = time.perf_counter()
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                c = client(app)
+                for i in range(requests):
+                    if i % 5 == 0:
+                        c.post('/api/v1/payments/batch', json={'payments': [PAYMENT]})
+                    else:
+                        c.get('/api/v1/students?limit=50')
+                os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        text = client(app).get('/metrics').get_data(as_text=True)
+        scrape_ms = (time.perf_counter() - started) * 1000
+        with app.app_context():
+            payments = get_db().execute('SELECT COUNT(*) FROM payments').fetchone()[0]
+        print(f'{workers} workers x {requests} requests in {seconds:.2f}s; scrape of '
+              f'{len(os.listdir(app.config["METRICS_DIR"]))} process files in {scrape_ms:.1f}ms')
+
+        posted = workers * ((requests + 4) // 5)
+        ok = check('requests counted across workers',
+                   sample(text, 'alfurqan_http_request_duration_seconds_count', endpoint='api.students') +
+                   sample(text, 'alfurqan_http_request_duration_seconds_count', endpoint='api.payments_batch')
+                   == workers * requests, f'{workers * requests} expected')
+        ok &= check('payments counted = payments in the database',
+                    sample(text, 'alfurqan_payments_recorded_total', source='api') == payments == posted,
+                    f'{payments} in the database')
+        ok &= check('payment amounts (kobo)',
+                    sample(text, 'alfurqan_payments_recorded_kobo_total', source='api') == posted * 250_000,
+                    f'{posted * 250_000:,} expected')
+        ok &= check('no connections left open by exited workers',
+                    sample(text, 'alfurqan_db_connections_open') == 0, 'gauge 0')
+        ok &= check('database statements counted',
+                    sample(text, 'alfurqan_db_queries_total', statement='insert') >= 2 * posted,
+                    f"{sample(text, 'alfurqan_db_queries_total', statement='select'):.0f} selects")
+
+        url = '/api/v1/students?limit=50'
+        with_metrics = per_request_ms(app, url)
+        without_metrics = per_request_ms(create_app({**CONFIG, 'METRICS_DIR': None}, instance_path=instance), url)
+        print(f'{url}: {without_metrics:.3f}ms without metrics, {with_metrics:.3f}ms with '
+              f'(+{(with_metrics - without_metrics) * 1000:.0f}us)')
+    finally:
+        shutil.rmtree(instance)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    sys.exit(main(*args))
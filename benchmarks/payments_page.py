@@ -0,0 +1,97 @@
+# benchmarks/payments_page.py
+# Measures the payments page over the wire: bytes sent and server time for identity, gzip
+# and (when installed) Brotli responses, plus an estimated time-to-render on a slow mobile
+# link. Also checks the static asset path: precompressed variants and immutable caching.
+#
+#   python benchmarks/payments_page.py [payments] [link kbit/s] [rtt ms]
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app, get_db
+from app import compression
+
+
+def seed(app, rows):
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO students (reg_number, name, class, term, academic_year) VALUES (?, ?, ?, ?, ?)',
+                       [(f'AFA/{i:05d}', f'Student {i}', f'Primary {i % 6 + 1}', 'First Term', '2025/2026')
+                        for i in range(rows // 3 + 1)])
+        db.executemany('''
+            INSERT INTO payments (student_reg_number, amount_kobo, payment_date, term, academic_year, recorded_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(f'AFA/{i // 3:05d}', (i * 137 % 90_000) * 100, f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+               ('First Term', 'Second Term', 'Third Term')[i % 3], '2025/2026', 'official') for i in range(rows)])
+        db.commit()
+
+
+def decompress(body, encoding):
+    if encoding == 'br':
+        return compression.brotli.decompress(body)
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        return zlib.decompress(body)
+    return body
+
+
+def main(rows=2_000, kbits=1_600, rtt_ms=150):
+    instance = tempfile.mkdtemp()
+    static = tempfile.mkdtemp()
+    try:
+        app = create_app({'SECRET_KEY': 'bench', 'DATABASE_AUTO_MIGRATE': True}, instance_path=instance)
+        seed(app, rows)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session.update(user_id=1, username='admin', role='admin')
+
+        print(f'payments page, {rows:,} payments; link {kbits} kbit/s, {rtt_ms}ms RTT')
+        encodings = ['identity', 'gzip'] + (['br'] if compression.brotli else [])
+        for encoding in encodings:
+            client.get('/payments', headers={'Accept-Encoding': encoding})  # warm-up
+            timings = []
+            for _ in range(5):
+                started = time.perf_counter()
+                response = client.get('/payments', headers={'Accept-Encoding': encoding})
+                timings.append(time.perf_counter() - started)
+            body = response.get_data()
+            started = time.perf_counter()
+            decompress(body, response.headers.get('Content-Encoding'))
+            client_ms = (time.perf_counter() - started) * 1000
+            server_ms = min(timings) * 1000
+            transfer_ms = len(body) * 8 / kbits
+            print(f'  {encoding:9s} {len(body):>10,} bytes  server {server_ms:7.1f}ms  '
+                  f'transfer {transfer_ms:8.1f}ms  est. time-to-render {server_ms + rtt_ms + transfer_ms + client_ms:8.1f}ms')
+
+        # Static assets: served from a copy of the static folder, with and without precompressed files.
+        shutil.rmtree(static)
+        shutil.copytree(app.static_folder, static)
+        app.static_folder = static
+        with app.test_request_context():
+            from flask import url_for
+            url = url_for('static', filename='css/style.css')
+        print(f'static asset {url}')
+        for label in ('no precompressed file', 'precompressed'):
+            if label == 'precompressed':
+                compression.precompress_static(static)
+            response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            body = response.get_data()
+            response.close()
+            print(f"  {label:24s} {len(body):>8,} bytes  Content-Encoding={response.headers.get('Content-Encoding')}  "
+                  f"Cache-Control={response.headers.get('Cache-Control')}")
+    finally:
+        shutil.rmtree(instance)
+        shutil.rmtree(static, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:4]]
+    sys.exit(main(*args))
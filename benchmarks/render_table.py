@@ -0,0 +1,83 @@
+# benchmarks/render_table.py
+# Renders the payments page with a 10k-row table and reports template compile time with
+# and without the bytecode cache, steady-state render time, and the format_currency filter
+# against the previous float()-based implementation.
+#
+#   python benchmarks/render_table.py [rows]
+import os
+import shutil
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import g, render_template
+
+from app import create_app, instrumentation
+from app.conversions import format_currency
+
+
+def old_format_currency(value):
+    try:
+        return "{:,.2f}".format(float(value))
+    except (ValueError, TypeError):
+        return value
+
+
+def payments(rows):
+    return [{
+        'payment_date': f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+        'student_name': f'Student {i}',
+        'amount_paid': (i * 137 % 9_000_000) / 100.0,
+        'term': 'First Term',
+        'academic_year': '2025/2026',
+        'recorded_by': 'official',
+    } for i in range(rows)]
+
+
+def main(rows=10_000):
+    data = payments(rows)
+    instance = tempfile.mkdtemp()
+    try:
+        def fresh_app():
+            return create_app({'TEMPLATE_PRELOAD': False, 'DATABASE_AUTO_MIGRATE': True}, instance_path=instance)
+
+        for label in ('compile payments.html, empty cache', 'compile payments.html, warm bytecode cache'):
+            app = fresh_app()
+            started = time.perf_counter()
+            app.jinja_env.get_template('payments.html')
+            print(f'{label:45s} {(time.perf_counter() - started) * 1000:8.2f}ms')
+
+        app = fresh_app()
+        with app.test_request_context('/payments'):
+            g.user = None
+            render_template('payments.html', payments=data)  # warm-up
+            instrumentation.reset()
+            for _ in range(5):
+                render_template('payments.html', payments=data)
+            stats = instrumentation.timings('template:')['template:payments.html']
+            print(f"{f'render {rows:,} rows (mean of 5)':45s} {stats['mean'] * 1000:8.2f}ms")
+
+            app.jinja_env.filters['format_currency'] = old_format_currency
+            instrumentation.reset()
+            for _ in range(5):
+                render_template('payments.html', payments=data)
+            stats = instrumentation.timings('template:')['template:payments.html']
+            print(f"{'  ... with the old format_currency':45s} {stats['mean'] * 1000:8.2f}ms")
+
+        amounts = [row['amount_paid'] for row in data] + [Decimal(i) / 100 for i in range(rows)]
+        for label, fn in (('format_currency x%d' % len(amounts), format_currency),
+                          ('old format_currency x%d' % len(amounts), old_format_currency)):
+            started = time.perf_counter()
+            for value in amounts:
+                fn(value)
+            print(f'{label:45s} {(time.perf_counter() - started) * 1000:8.2f}ms')
+    finally:
+        shutil.rmtree(instance)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
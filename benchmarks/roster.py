@@ -0,0 +1,111 @@
+# benchmarks/roster.py
+# Student list in app.py: the previous ORM path (Student instances, get_fee_status per
+# student) against the cached roster projection. Reports memory held per 10k students,
+# time to build the list, and time to render it.
+#
+#   python benchmarks/roster.py [students]
+import gc
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+from jinja2 import Template
+
+TABLE = Template('''<table>{% for s in students %}
+<tr><td>{{ s.reg_number }}</td><td>{{ s.name }}</td><td>{{ s.gender }}</td><td>{{ s.student_class }}</td>
+<td>{{ s.term }}</td><td>{{ s.academic_year }}</td><td>{{ s.fee_status }}</td></tr>{% endfor %}
+</table>''')
+
+
+def load_app(instance):
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(instance, 'roster.sqlite')}", ALFURQAN_DESKTOP='1')
+    spec = importlib.util.spec_from_file_location('app_single', os.path.join(ROOT, 'app.py'))
+    single = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(single)
+    return single, single.create_app()
+
+
+def seed(single, students):
+    db = single.db
+    db.create_all()
+    classes = sorted({cls for cls, _ in single.FEE_STRUCTURE})
+    academic_year, term = single.get_current_school_period()
+    db.session.add(single.User(username='admin', password='-', role='admin'))
+    db.session.execute(single.Student.__table__.insert(), [{
+        'reg_number': f'AFA/{i:06d}', 'name': f'Student {i:06d}', 'gender': 'F' if i % 2 else 'M',
+        'student_class': classes[i % len(classes)], 'term': term, 'academic_year': academic_year,
+        'admission_date': date(2024, 9, 1),
+    } for i in range(students)])
+    db.session.execute(single.PaymentEvent.__table__.insert(), [{
+        'payment_id': i, 'student_reg_number': f'AFA/{i:06d}', 'academic_year': academic_year, 'term': term,
+        'event_type': 'created', 'amount_kobo': 5_000_000 + (i % 7) * 1_000_000, 'recorded_by': 1,
+        'recorded_at': date(2025, 10, 1),
+    } for i in range(0, students, 2)])
+    db.session.commit()
+
+
+def orm_path(single):
+    academic_year, term = single.get_current_school_period()
+    students = single.Student.query.order_by(single.Student.name).all()
+    for student in students:
+        student.fee_status = single.get_fee_status(student.reg_number, academic_year, term)
+    return students
+
+
+def projection_path(single):
+    academic_year, term = single.get_current_school_period()
+    return single.with_fee_status(single.roster(), academic_year, term)
+
+
+def measure(label, app, build, students):
+    # Time and memory are taken on separate runs, as tracing allocations slows the build.
+    with app.test_request_context():
+        started = time.perf_counter()
+        result = build()
+        build_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        TABLE.render(students=result)
+        render_ms = (time.perf_counter() - started) * 1000
+    with app.test_request_context():
+        gc.collect()
+        tracemalloc.start()
+        result = build()
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    per_10k = held * 10_000 / students / 1024 / 1024
+    print(f'{label:40s} build {build_ms:9.1f}ms  render {render_ms:7.1f}ms  {per_10k:7.2f} MB per 10k students')
+
+
+def main(students=10_000):
+    instance = tempfile.mkdtemp()
+    try:
+        single, app = load_app(instance)
+        with app.app_context():
+            seed(single, students)
+        print(f'{students:,} students')
+        cache = app.extensions['roster_cache']
+
+        def cold():
+            cache.clear()
+            return projection_path(single)
+
+        measure('ORM instances + get_fee_status', app, lambda: orm_path(single), students)
+        measure('roster projection, cold cache', app, cold, students)
+        measure('roster projection, warm cache', app, lambda: projection_path(single), students)
+        with app.app_context():
+            single.db.engine.dispose()
+    finally:
+        shutil.rmtree(instance)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
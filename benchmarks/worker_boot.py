@@ -0,0 +1,111 @@
+# benchmarks/worker_boot.py
+# Worker boot cost for the app package, the way gunicorn starts workers on Linux:
+#   - create_app() with the old every-boot schema work (all migration steps) against the
+#     stored-version check;
+#   - fork-to-first-request latency for N forked workers, with and without --preload
+#     (app created once in the master before forking, or in every worker after it).
+#
+#   python benchmarks/worker_boot.py [workers] [payments]
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def seed(instance, payments):
+    from app import create_app, get_db
+
+    app = create_app({'DATABASE_AUTO_MIGRATE': True}, instance_path=instance)
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO students (reg_number, name, class, term, academic_year) VALUES (?, ?, ?, ?, ?)',
+                       [(f'AFA-{i:05d}', f'Student {i}', 'JSS 1', 'First Term', '2025/2026') for i in range(1000)])
+        db.executemany('INSERT INTO payments (student_reg_number, amount_kobo, payment_date, term, academic_year, '
+                       'recorded_by) VALUES (?, ?, ?, ?, ?, ?)',
+                       [(f'AFA-{i % 1000:05d}', 500_000, '2025-10-01', 'First Term', '2025/2026', 'admin')
+                        for i in range(payments)])
+        db.commit()
+
+
+def boot_times(instance, runs=5):
+    from app import create_app, get_db, models
+
+    config = {'SECRET_KEY': 'bench', 'TEMPLATE_PRELOAD': False, 'TEMPLATE_CACHE_DIR': None}
+
+    def old_boot():
+        app = create_app(config, instance_path=instance)
+        with app.app_context():
+            # What init_db() did on every boot before the schema version was stored.
+            for _, step in models.MIGRATIONS:
+                step(get_db())
+
+    def new_boot():
+        create_app(config, instance_path=instance)
+
+    for label, boot in (('create_app() + schema work every boot', old_boot),
+                        ('create_app() + stored version check', new_boot)):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            boot()
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f'{label:44s} {min(timings):8.1f}ms')
+
+
+def forked_workers(instance, workers, preload):
+    """Runs in a fresh interpreter so that, without preload, nothing is imported before the fork."""
+    config = {'SECRET_KEY': 'bench'}
+    if preload:
+        from app import create_app
+        app = create_app(config, instance_path=instance)
+    pipes = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        forked_at = time.perf_counter()
+        if os.fork() == 0:
+            os.close(read_end)
+            if not preload:
+                from app import create_app
+                app = create_app(config, instance_path=instance)
+            app.test_client().get('/')
+            os.write(write_end, f'{(time.perf_counter() - forked_at) * 1000:.3f}'.encode())
+            os._exit(0)
+        os.close(write_end)
+        pipes.append(read_end)
+    timings = []
+    for read_end in pipes:
+        timings.append(float(os.read(read_end, 64)))
+        os.close(read_end)
+    for _ in range(workers):
+        os.wait()
+    timings.sort()
+    label = f"fork to first request, {'--preload' if preload else 'no preload'} ({workers} workers)"
+    print(f'{label:44s} {timings[len(timings) // 2]:8.1f}ms median, {timings[-1]:.1f}ms max')
+
+
+def main(workers=4, payments=20_000):
+    if not hasattr(os, 'fork'):
+        print('Forked workers need a POSIX system (as gunicorn does).')
+        return 1
+    instance = tempfile.mkdtemp()
+    try:
+        seed(instance, payments)
+        boot_times(instance)
+        for preload in ('0', '1'):
+            subprocess.run([sys.executable, __file__, '--fork', instance, str(workers), preload], check=True)
+    finally:
+        shutil.rmtree(instance)
+    return 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--fork']:
+        forked_workers(sys.argv[2], int(sys.argv[3]), sys.argv[4] == '1')
+        sys.exit(0)
+    args = [int(arg) for arg in sys.argv[1:3]]
+    sys.exit(main(*args))
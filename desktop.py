@@ -0,0 +1,180 @@
+# desktop.py
+# Desktop launch mode for app.py, the application the offline office build ships (see
+# AlfurqanAcademy.spec: the frozen app.py hands over to main() here).
+#
+#   python desktop.py                      serve on 127.0.0.1 and open the browser
+#   python desktop.py --headless --port N  serve without a browser (Linux CI, benchmarks)
+#   python desktop.py --build-db PATH      write the pre-migrated database that the build ships
+#   python desktop.py --profile            profile startup up to the first served page
+#
+# Only the standard library is imported at module level; Flask and the app are imported
+# when the server starts, so the splash-to-first-page time is what the user waits for.
+# app.py reads its configuration from the environment, which is set here before it loads.
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+
+APP_NAME = 'AlfurqanAcademy'
+DB_FILENAME = 'alfurqan_academy.db'
+
+
+def bundle_dir():
+    """Directory holding the bundled resources (the PyInstaller temp dir when frozen)."""
+    return getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+
+
+def user_data_dir():
+    """Per-user folder that survives between runs, e.g. %APPDATA%\\AlfurqanAcademy."""
+    base = os.environ.get('APPDATA') or os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, APP_NAME)
+
+
+def load_app_module():
+    """
+    app.py as a module. Frozen, it is the script that is running; from source it is loaded
+    from its file, since the app/ package next to it (whose helpers it uses) owns the
+    import name `app`.
+    """
+    main = sys.modules.get('__main__')
+    if os.path.basename(getattr(main, '__file__', None) or '') == 'app.py':
+        return main
+    module = sys.modules.get('alfurqan_app')
+    if module is None:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location('alfurqan_app', os.path.join(bundle_dir(), 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def configure_environment(database, secret_key=None):
+    """Points app.py at the desktop database, before it creates the app."""
+    os.environ['ALFURQAN_DESKTOP'] = '1'
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(database)
+    # One process and nobody scraping it: don't leave a metrics file per launch behind.
+    os.environ['METRICS_DIR'] = ''
+    if secret_key:
+        os.environ['SECRET_KEY'] = secret_key
+
+
+def build_database(path):
+    """Creates every table and index in a fresh database file, ready to be bundled."""
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    configure_environment(path)
+    module = load_app_module()
+    app = module.create_app()
+    with app.app_context():
+        module.db.create_all()
+        with module.db.engine.begin() as connection:
+            connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+        with module.db.engine.connect() as connection:
+            connection.execution_options(isolation_level='AUTOCOMMIT').exec_driver_sql('VACUUM')
+    return path
+
+
+def prepare_database(instance_path):
+    """Copies the bundled, pre-migrated database into the user's folder on first launch."""
+    os.makedirs(instance_path, exist_ok=True)
+    target = os.path.join(instance_path, DB_FILENAME)
+    bundled = os.environ.get('ALFURQAN_BUNDLED_DB') or os.path.join(bundle_dir(), DB_FILENAME)
+    if not os.path.exists(target) and os.path.exists(bundled) and os.path.getsize(bundled) > 0:
+        shutil.copyfile(bundled, target)
+    return target
+
+
+def create_desktop_app(instance_path=None):
+    instance_path = instance_path or user_data_dir()
+    database = prepare_database(instance_path)
+    configure_environment(database, os.environ.get('SECRET_KEY') or _secret_key(instance_path))
+    # Compiled templates persist in the user's folder (the bundle directory is temporary);
+    # one process, so templates are compiled when first rendered rather than all at boot.
+    os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(instance_path, 'jinja_cache')
+    os.environ['TEMPLATE_PRELOAD'] = '0'
+
+    module = load_app_module()
+    app = module.create_app()
+    with app.app_context():
+        # Running from source without a built database, or after an update that ships a
+        # newer schema, the file is brought up to date; otherwise this is one inspection.
+        if module.missing_schema(module.db.engine):
+            module.db.create_all()
+            module.normalize_legacy_columns(module.db.engine)
+    return app
+
+
+def _secret_key(instance_path):
+    # Keep sessions valid across restarts of the office PC.
+    path = os.path.join(instance_path, 'secret_key')
+    if not os.path.exists(path):
+        import secrets
+        with open(path, 'w') as f:
+            f.write(secrets.token_hex(32))
+    with open(path) as f:
+        return f.read().strip()
+
+
+def serve(port=0, headless=False, instance_path=None, ready=None):
+    started = time.perf_counter()
+    from werkzeug.serving import make_server
+
+    app = create_desktop_app(instance_path)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    url = f'http://127.0.0.1:{server.server_port}/'
+    # Printed (and flushed) so benchmarks/cold_start.py can find the port.
+    print(f'Serving {url} (app ready in {time.perf_counter() - started:.3f}s)', flush=True)
+    if ready is not None:
+        ready(server, url)
+    if not headless:
+        import webbrowser
+        threading.Timer(0.2, webbrowser.open, args=(url,)).start()
+    server.serve_forever()
+
+
+def profile_startup(output='desktop_startup.prof', instance_path=None):
+    """Profiles imports, create_app() and the first served page, then prints the top entries."""
+    import cProfile
+    import pstats
+    import urllib.request
+
+    profiler = cProfile.Profile()
+
+    def first_page(server, url):
+        def fetch():
+            urllib.request.urlopen(url).read()
+            profiler.disable()
+            server.shutdown()
+        threading.Thread(target=fetch, daemon=True).start()
+
+    profiler.enable()
+    serve(headless=True, instance_path=instance_path, ready=first_page)
+    profiler.dump_stats(output)
+    pstats.Stats(output).sort_stats('cumulative').print_stats(25)
+    print(f'Full profile written to {output}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Alfurqan Academy desktop launcher')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--headless', action='store_true', help='do not open a browser window')
+    parser.add_argument('--instance-path', help='folder for the database (default: per-user data folder)')
+    parser.add_argument('--build-db', metavar='PATH', help='write a pre-migrated database and exit')
+    parser.add_argument('--profile', nargs='?', const='desktop_startup.prof', metavar='OUTPUT',
+                        help='profile startup to the first served page and exit')
+    args = parser.parse_args(argv)
+
+    if args.build_db:
+        print(f'Wrote {build_database(args.build_db)}')
+    elif args.profile:
+        profile_startup(args.profile, args.instance_path)
+    else:
+        serve(args.port, args.headless, args.instance_path)
+
+
+if __name__ == '__main__':
+    main()
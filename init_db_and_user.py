@@ -1,6 +1,7 @@
 import os
 import sqlite3
-from app import create_app, init_db
+from app import create_app
+from app.models import init_db
 
 # Create an app context to use Flask's features
 app = create_app()
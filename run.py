@@ -1,7 +1,8 @@
 # run.py
 from app import create_app
 
-app = create_app()
+# Started directly (the dev server), bring the database schema up to date on boot.
+app = create_app({'DATABASE_AUTO_MIGRATE': __name__ == '__main__'})
 
 if __name__ == '__main__':
     # Default users for testing: